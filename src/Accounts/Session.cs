@@ -179,7 +179,13 @@ public class Session : IEquatable<Session>
             {
                 try
                 {
-                    return img.ConvertTo(format, User.Settings.FileFormat.SaveMetadata ? metadata : null, User.Settings.FileFormat.DPI, Math.Clamp(User.Settings.FileFormat.ImageQuality, 1, 100), User.Settings.FileFormat.StealthMetadata);
+                    string metadataToSave = User.Settings.FileFormat.SaveMetadata ? metadata : null;
+                    // Outputs the backend already encoded in the final format (see WGNodeData.SaveOutput) only need their metadata attached
+                    if (User.Settings.FileFormat.DPI == 0 && (metadataToSave is null || User.Settings.FileFormat.StealthMetadata.ToLowerFast() == "false") && img.TryConvertWithoutReencode(format, metadataToSave) is ImageFile asIs)
+                    {
+                        return asIs;
+                    }
+                    return img.ConvertTo(format, metadataToSave, User.Settings.FileFormat.DPI, Math.Clamp(User.Settings.FileFormat.ImageQuality, 1, 100), User.Settings.FileFormat.StealthMetadata);
                 }
                 catch (Exception ex)
                 {
@@ -259,7 +265,21 @@ public class Session : IEquatable<Session>
                             File.WriteAllBytes(fullPathNoExt + ".swarm.json", metadata.EncodeUTF8());
                         }
                     }
-                    OutputMetadataTracker.GetOrCreatePreviewFor(fullPath.Replace('\\', '/'));
+                    byte[] knownPreview = null;
+                    if (image.PreviewJpg is not null && image.File.Type.MetaType == MediaMetaType.Image)
+                    {
+                        ImageFile preview = new Image(image.PreviewJpg, MediaType.ImageJpg);
+                        knownPreview = preview.ToMetadataJpg(metadata)?.RawData;
+                    }
+                    else if (image.PreviewJpg is not null)
+                    {
+                        File.WriteAllBytes(fullPathNoExt + ".swarmpreview.jpg", image.PreviewJpg);
+                        if (image.PreviewAnimWebp is not null && Program.ServerSettings.UI.AllowAnimatedPreviews)
+                        {
+                            File.WriteAllBytes(fullPathNoExt + ".swarmpreview.webp", image.PreviewAnimWebp);
+                        }
+                    }
+                    OutputMetadataTracker.GetOrCreatePreviewFor(fullPath.Replace('\\', '/'), knownPreview);
                     Logs.Debug($"Saved an output file as '{fullPath}'");
                     await Task.Delay(TimeSpan.FromSeconds(10)); // (Give time for WebServer to read data from cache rather than having to reload from file for first read)
                     StillSavingFiles.TryRemove(fullPath, out _);
@@ -16,6 +16,8 @@ using Newtonsoft.Json;
 using System.Buffers.Binary;
 using SwarmUI.Media;
 using SwarmUI.WebAPI;
+using SixLabors.ImageSharp.PixelFormats;
+using ISImage = SixLabors.ImageSharp.Image;
 
 namespace SwarmUI.Builtin_ComfyUIBackend;
 
@@ -321,6 +323,7 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
             }
             takeOutput(toSend);
         }
+        Dictionary<string, OutputStreamSpool> outputStreams = [];
         try
         {
             workflow = $"{{\"prompt\": {workflow}, \"client_id\": \"{id}\"}}";
@@ -354,6 +357,8 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
             bool isExpectingText = false;
             string currentNode = "";
             bool isMe = false;
+            int pendingAsyncOutputs = 0;
+            bool promptFinished = false;
             // autoCanceller will be cancelled via the using to end the task and not leave it waiting when the method clears
             using CancellationTokenSource autoCanceller = new();
             using CancellationTokenSource interruptCanceller = CancellationTokenSource.CreateLinkedTokenSource(interrupt, autoCanceller.Token);
@@ -421,6 +426,12 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
                                 string nodeId = $"{json["data"]["node"]}";
                                 if (nodeId == "") // Not true null for some reason, so, ... this.
                                 {
+                                    if (pendingAsyncOutputs > 0)
+                                    {
+                                        Logs.Verbose($"ComfyUI prompt {promptId} finished executing, waiting for {pendingAsyncOutputs} async outputs");
+                                        promptFinished = true;
+                                        break;
+                                    }
                                     goto endloop;
                                 }
                                 currentNode = nodeId;
@@ -459,6 +470,21 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
                                 break;
                             case "status": // queuing
                                 break;
+                            case "swarm_async_output": // A save node handed outputs to its background encoder, they will arrive after the prompt itself is done
+                                if (!IsAsyncOutputForPrompt(json["data"] as JObject, promptId))
+                                {
+                                    Logs.Debug($"ComfyUI async output notice for another prompt ({json["data"]?["prompt_id"]}) ignored by prompt {promptId}");
+                                    break;
+                                }
+                                pendingAsyncOutputs += json["data"].Value<int>("count");
+                                break;
+                            case "swarm_async_output_failed":
+                                if (!IsAsyncOutputForPrompt(json["data"] as JObject, promptId))
+                                {
+                                    Logs.Debug($"ComfyUI async output failure for another prompt ({json["data"]?["prompt_id"]}) ignored by prompt {promptId}: {json["data"]?["error"]}");
+                                    break;
+                                }
+                                throw new SwarmReadableErrorException($"ComfyUI failed to encode an output: {json["data"]["error"]}");
                             default:
                                 Logs.Verbose($"Ignore type {json["type"]}");
                                 break;
@@ -467,6 +493,9 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
                     else
                     {
                         (MediaType mediaType, int index, int eventId, int preBytes) = ComfyRawWebsocketOutputToFormatLabel(output);
+                        JObject outputMeta = ComfyRawWebsocketOutputMetadata(output, eventId);
+                        bool isAsyncOutput = outputMeta?.Value<bool?>("async_output") ?? false;
+                        string outputStreamId = outputMeta?.Value<string>("stream_id");
                         Logs.Verbose($"ComfyUI Websocket sent: {output.Length} bytes of image data as event {eventId} in format {mediaType} to index {index}");
                         if (isExpectingText || mediaType.MetaType == MediaMetaType.Text)
                         {
@@ -500,14 +529,30 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
                                 }
                             }
                         }
-                        else if (isReceivingOutputs)
+                        else if (isAsyncOutput && !IsAsyncOutputForPrompt(outputMeta, promptId))
+                        {
+                            // Eg an earlier prompt on this socket was interrupted while its outputs were still encoding
+                            Logs.Debug($"ComfyUI async output for another prompt ({outputMeta["prompt_id"]}) ignored by prompt {promptId}");
+                        }
+                        else if (isReceivingOutputs || isAsyncOutput || (outputStreamId is not null && isMe))
                         {
+                            (byte[] fileData, byte[] previewJpg, byte[] previewAnimWebp) = SplitOutputPreviews(output, outputMeta, preBytes);
+                            if (outputStreamId is not null)
+                            {
+                                fileData = ReceiveOutputStreamPiece(outputStreams, outputStreamId, outputMeta, fileData);
+                                if (fileData is null)
+                                {
+                                    continue;
+                                }
+                            }
+                            // Async outputs arrive while other nodes may already be running, so they carry their own node ID
+                            string outputNode = isAsyncOutput ? $"{outputMeta["node_id"]}" : currentNode;
                             if (isExpectingVideo && mediaType == MediaType.ImageJpg) // Fall back correction for some unspecified data
                             {
                                 mediaType = MediaType.VideoMp4;
                             }
                             bool isReal = true;
-                            if (currentNode is not null && int.TryParse(currentNode, out int nodeIdNum) && ((nodeIdNum < 100 && nodeIdNum != 9) || nodeIdNum >= 50000))
+                            if (outputNode is not null && int.TryParse(outputNode, out int nodeIdNum) && ((nodeIdNum < 100 && nodeIdNum != 9) || nodeIdNum >= 50000))
                             {
                                 // Reserved nodes that aren't the final output are intermediate outputs, or nodes in the 50,000+ range.
                                 isReal = false;
@@ -520,14 +565,23 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
                                     ["backend_id"] = BackendData.ID,
                                     ["debug_internal_prompt"] = user_input.Get(T2IParamTypes.Prompt),
                                     ["backend_usages"] = BackendData.Usages,
-                                    ["comfy_output_node"] = currentNode,
+                                    ["comfy_output_node"] = outputNode,
                                     ["comfy_is_real"] = isReal,
                                     ["comfy_img_type"] = $"{mediaType}",
                                     ["comfy_event_id"] = eventId,
                                     ["comfy_index"] = index
                                 };
                             }
-                            takeOutput(new T2IEngine.ImageOutput() { File = new Image(output[preBytes..], mediaType), IsReal = isReal, BackendInternalHint = currentNode, GenTimeMS = firstStep == 0 ? -1 : (Environment.TickCount64 - firstStep) });
+                            MediaFile outFile = IsRawPixelsOutput(output, eventId) ? RawPixelsOutputToImage(output, preBytes) : new Image(fileData, mediaType);
+                            takeOutput(new T2IEngine.ImageOutput() { File = outFile, PreviewJpg = previewJpg, PreviewAnimWebp = previewAnimWebp, IsReal = isReal, BackendInternalHint = outputNode, GenTimeMS = firstStep == 0 ? -1 : (Environment.TickCount64 - firstStep) });
+                            if (isAsyncOutput)
+                            {
+                                pendingAsyncOutputs--;
+                                if (promptFinished && pendingAsyncOutputs <= 0)
+                                {
+                                    goto endloop;
+                                }
+                            }
                         }
                         else
                         {
@@ -582,6 +636,10 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
         }
         finally
         {
+            foreach (OutputStreamSpool spool in outputStreams.Values)
+            {
+                spool.Discard();
+            }
             if (!socket.CloseStatus.HasValue)
             {
                 ReusableSockets.Enqueue(new() { ID = id, Socket = socket });
@@ -650,6 +708,137 @@ public abstract class ComfyUIAPIAbstractBackend : AbstractT2IBackend
         }
     }
 
+    /// <summary>Returns the JSON metadata header of a raw websocket output, or null if the output type does not have one.</summary>
+    public static JObject ComfyRawWebsocketOutputMetadata(byte[] output, int eventId)
+    {
+        if (eventId != 4)
+        {
+            return null;
+        }
+        int metaLength = BinaryPrimitives.ReverseEndianness(BitConverter.ToInt32(output, 4));
+        return Utilities.ParseToJson(StringConversionHelper.UTF8Encoding.GetString(output, 8, metaLength));
+    }
+
+    /// <summary>Splits any pre-made preview files (as sent by `SwarmSaveImageWS` or `SwarmSaveAnimationWS` with 'preview' enabled) off the end of a raw websocket output. Returns (mainFileData, previewJpg, previewAnimWebp), with null for any preview not included.</summary>
+    public static (byte[], byte[], byte[]) SplitOutputPreviews(byte[] output, JObject jmeta, int preBytes)
+    {
+        if (jmeta is null)
+        {
+            return (output[preBytes..], null, null);
+        }
+        int jpgLength = jmeta.Value<int?>("preview_jpg_length") ?? 0;
+        int webpLength = jmeta.Value<int?>("preview_webp_length") ?? 0;
+        int mainEnd = output.Length - jpgLength - webpLength;
+        if (jpgLength < 0 || webpLength < 0 || mainEnd < preBytes)
+        {
+            Logs.Warning($"ComfyUI backend sent invalid output preview lengths (jpg={jpgLength}, webp={webpLength}, total={output.Length}), ignoring previews.");
+            return (output[preBytes..], null, null);
+        }
+        return (output[preBytes..mainEnd], jpgLength > 0 ? output[mainEnd..(mainEnd + jpgLength)] : null, webpLength > 0 ? output[(mainEnd + jpgLength)..] : null);
+    }
+
+    /// <summary>A streamed output (as sent by `SwarmSaveAnimationWS` with 'stream_output' enabled) that is being received, written piece by piece to a temp file as it arrives.</summary>
+    public class OutputStreamSpool
+    {
+        /// <summary>Path of the temp file the pieces are written to.</summary>
+        public string Path = System.IO.Path.Combine(System.IO.Path.GetTempPath(), $"swarm-comfy-stream-{Guid.NewGuid():N}.tmp");
+
+        /// <summary>The open temp file.</summary>
+        public FileStream File;
+
+        /// <summary>The sequence number of the next expected piece.</summary>
+        public int NextSeq = 0;
+
+        public OutputStreamSpool()
+        {
+            File = new(Path, FileMode.CreateNew, FileAccess.Write, FileShare.None);
+        }
+
+        /// <summary>Closes and deletes the temp file, for a stream that will not be finished.</summary>
+        public void Discard()
+        {
+            File.Dispose();
+            System.IO.File.Delete(Path);
+        }
+
+        /// <summary>Closes the temp file of a finished stream and returns its contents. The temp file is always deleted, even if reading it fails.</summary>
+        public byte[] ReadAndDelete()
+        {
+            try
+            {
+                File.Dispose();
+                return System.IO.File.ReadAllBytes(Path);
+            }
+            finally
+            {
+                System.IO.File.Delete(Path);
+            }
+        }
+    }
+
+    /// <summary>Writes one piece of a streamed output (as sent by `SwarmSaveAnimationWS` with 'stream_output' enabled) to its temp file in <paramref name="streams"/> as it arrives, so that a long video is never held in memory piece by piece.
+    /// Returns the data of the complete file once the final marker arrives (its temp file is deleted then), or null while the stream is still in progress.
+    /// Unfinished streams left in <paramref name="streams"/> must be <see cref="OutputStreamSpool.Discard"/>ed by the caller.</summary>
+    public static byte[] ReceiveOutputStreamPiece(Dictionary<string, OutputStreamSpool> streams, string streamId, JObject jmeta, byte[] data)
+    {
+        int seq = jmeta.Value<int?>("stream_seq") ?? -1;
+        OutputStreamSpool spool = streams.GetValueOrDefault(streamId);
+        if (seq != (spool?.NextSeq ?? 0))
+        {
+            throw new SwarmReadableErrorException($"ComfyUI backend sent streamed output {streamId} out of order (expected piece {spool?.NextSeq ?? 0}, got {seq}).");
+        }
+        if (spool is null)
+        {
+            spool = new();
+            streams[streamId] = spool;
+        }
+        spool.File.Write(data);
+        spool.NextSeq++;
+        if (jmeta.Value<bool?>("stream_final") ?? false)
+        {
+            streams.Remove(streamId);
+            return spool.ReadAndDelete();
+        }
+        return null;
+    }
+
+    /// <summary>Returns true if an async output's metadata, or the data of a 'swarm_async_output' or 'swarm_async_output_failed' event, belongs to the given prompt.
+    /// Async outputs can arrive long after their own prompt ended, eg on a reused socket after an interrupt, so they must always be matched by prompt ID.</summary>
+    public static bool IsAsyncOutputForPrompt(JObject data, string promptId)
+    {
+        return data is not null && $"{data["prompt_id"]}" == promptId;
+    }
+
+    /// <summary>Returns true if the given raw websocket output is a raw pixel buffer, as sent by `SwarmSaveImageWS` in 'raw_uint8' or 'raw_uint16' mode.</summary>
+    public static bool IsRawPixelsOutput(byte[] output, int eventId)
+    {
+        return eventId == 10 && output.Length >= 8 && BinaryPrimitives.ReadInt32BigEndian(output.AsSpan(4)) == 0;
+    }
+
+    /// <summary>Decodes a raw pixel buffer output (width, height, channels, bytes-per-channel, row stride as big-endian int32s, followed by tightly packed little-endian RGB rows) into an image.
+    /// The image is held as decoded pixels and not encoded here, so that it is only encoded once, to the final output format, when it is saved.</summary>
+    public static Image RawPixelsOutputToImage(byte[] output, int preBytes)
+    {
+        ReadOnlySpan<byte> data = output.AsSpan(preBytes);
+        if (data.Length < 20)
+        {
+            throw new SwarmReadableErrorException("Invalid raw pixel output from ComfyUI backend (missing header).");
+        }
+        int width = BinaryPrimitives.ReadInt32BigEndian(data);
+        int height = BinaryPrimitives.ReadInt32BigEndian(data[4..]);
+        int channels = BinaryPrimitives.ReadInt32BigEndian(data[8..]);
+        int bytesPerChannel = BinaryPrimitives.ReadInt32BigEndian(data[12..]);
+        int stride = BinaryPrimitives.ReadInt32BigEndian(data[16..]);
+        data = data[20..];
+        if (width <= 0 || height <= 0 || channels != 3 || (bytesPerChannel != 1 && bytesPerChannel != 2) || stride != width * channels * bytesPerChannel || data.Length < (long)stride * height)
+        {
+            throw new SwarmReadableErrorException($"Invalid raw pixel output from ComfyUI backend (width={width}, height={height}, channels={channels}, bytesPerChannel={bytesPerChannel}, stride={stride}, length={data.Length}).");
+        }
+        data = data[..(stride * height)];
+        ISImage img = bytesPerChannel == 1 ? ISImage.LoadPixelData<Rgb24>(data, width, height) : ISImage.LoadPixelData<Rgb48>(data, width, height);
+        return ImageFile.FromDecodedPixels(img);
+    }
+
     private async Task<MediaFile[]> GetAllImagesForHistory(JToken output, T2IParamInput userInput, CancellationToken interrupt)
     {
         if (Logs.MinimumLevel <= Logs.LogLevel.Verbose)
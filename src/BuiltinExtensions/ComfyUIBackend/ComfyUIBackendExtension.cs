@@ -71,6 +71,14 @@ public class ComfyUIBackendExtension : Extension
         ["OverrideCLIPDevice"] = "set_clip_device"
     };
 
+    /// <summary>Extensible map of ComfyUI Node IDs and optional input IDs to supported feature IDs, for inputs that older versions of a node lack.</summary>
+    public static Dictionary<(string, string), string> NodeInputToFeatureMap = new()
+    {
+        [("SwarmSaveImageWS", "preview")] = "comfy_saveimage_ws_preview",
+        [("SwarmSaveImageWS", "format")] = "comfy_saveimage_ws_format",
+        [("SwarmSaveAnimationWS", "preview")] = "comfy_saveanimation_ws_preview"
+    };
+
     /// <inheritdoc/>
     public override void OnPreInit()
     {
@@ -592,6 +600,13 @@ public class ComfyUIBackendExtension : Extension
                     FeaturesDiscardIfNotFound.Remove(featureId);
                 }
             }
+            foreach (((string node, string input), string featureId) in NodeInputToFeatureMap)
+            {
+                if (rawObjectInfo.TryGetValue(node, out JToken nodeInfo) && nodeInfo["input"]?["optional"]?[input] is not null)
+                {
+                    FeaturesSupported.Add(featureId);
+                }
+            }
             foreach (string feature in FeaturesDiscardIfNotFound)
             {
                 FeaturesSupported.Remove(feature);
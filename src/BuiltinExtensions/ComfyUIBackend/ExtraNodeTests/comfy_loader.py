@@ -0,0 +1,21 @@
+# Loads Swarm node modules for tests the same way ComfyUI loads custom nodes.
+import importlib, importlib.util, os, sys
+
+EXTRA_NODES_DIR = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "ExtraNodes"))
+
+def comfy_package_name(folder: str) -> str:
+    """Returns the module name ComfyUI loads a custom node folder under, which is built from its full path rather than the bare folder name."""
+    return os.path.join(EXTRA_NODES_DIR, folder).replace(".", "_x_")
+
+def register_package(folder: str) -> str:
+    """Registers a node folder as a package under the same name ComfyUI uses, without running its __init__ (which imports every node in the folder, and all of ComfyUI with them)."""
+    name = comfy_package_name(folder)
+    if name not in sys.modules:
+        path = os.path.join(EXTRA_NODES_DIR, folder)
+        spec = importlib.util.spec_from_file_location(name, os.path.join(path, "__init__.py"), submodule_search_locations=[path])
+        sys.modules[name] = importlib.util.module_from_spec(spec)
+    return name
+
+def load_node_module(folder: str, module: str):
+    """Imports one node module from a node folder, eg load_node_module("SwarmComfyCommon", "SwarmSaveImageWS")."""
+    return importlib.import_module(f"{register_package(folder)}.{module}")
@@ -0,0 +1,9 @@
+class web:
+    class Response:
+        def __init__(self, data, status):
+            self.data = data
+            self.status = status
+
+    @staticmethod
+    def json_response(data, status=200):
+        return web.Response(data, status)
@@ -0,0 +1,12 @@
+def model_lora_keys_unet(model, key_map={}):
+    for key in model.state_dict().keys():
+        if key.endswith(".weight"):
+            key_map[f"lora_unet_{key[:-len('.weight')].replace('.', '_')}"] = key
+            key_map[f"diffusion_model.{key[:-len('.weight')]}"] = ("diffusion_model", key)
+    return key_map
+
+def model_lora_keys_clip(model, key_map={}):
+    for key in model.state_dict().keys():
+        if key.endswith(".weight"):
+            key_map[f"lora_te_{key[:-len('.weight')].replace('.', '_')}"] = key
+    return key_map
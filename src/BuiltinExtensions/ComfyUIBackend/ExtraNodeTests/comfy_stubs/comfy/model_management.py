@@ -0,0 +1,7 @@
+import torch
+
+def get_torch_device():
+    return torch.device("cpu")
+
+def unload_all_models():
+    pass
@@ -0,0 +1,2 @@
+def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+    raise NotImplementedError("Tests patch in their own LoRA application")
@@ -0,0 +1,17 @@
+import safetensors.torch
+
+def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
+    return safetensors.torch.load_file(ckpt)
+
+class ProgressBar:
+    def __init__(self, total):
+        self.total = total
+        self.current = 0
+
+    def update_absolute(self, value, total=None, preview=None):
+        self.current = value
+        if total is not None:
+            self.total = total
+
+    def update(self, value):
+        self.update_absolute(self.current + value)
@@ -0,0 +1,7 @@
+class VideoFromFile:
+    def __init__(self, file):
+        self.file = file
+
+class VideoFromComponents:
+    def __init__(self, components):
+        self.components = components
@@ -0,0 +1,8 @@
+from dataclasses import dataclass
+
+@dataclass
+class VideoComponents:
+    images: object
+    audio: object = None
+    frame_rate: object = None
+    metadata: object = None
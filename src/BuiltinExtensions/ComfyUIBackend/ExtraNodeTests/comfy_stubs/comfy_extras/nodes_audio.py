@@ -0,0 +1,2 @@
+def load(file):
+    raise NotImplementedError("Audio decoding is not available in the test stubs")
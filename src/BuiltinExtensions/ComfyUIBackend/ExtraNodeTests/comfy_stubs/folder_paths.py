@@ -0,0 +1,26 @@
+import os, tempfile
+
+base_path = tempfile.mkdtemp(prefix="swarm-node-tests-")
+models_dir = os.path.join(base_path, "models")
+supported_pt_extensions = {".safetensors"}
+folder_names_and_paths = {"loras": ([os.path.join(models_dir, "loras")], supported_pt_extensions)}
+
+def get_user_directory():
+    return os.path.join(base_path, "user")
+
+def get_temp_directory():
+    return os.path.join(base_path, "temp")
+
+def get_output_directory():
+    return os.path.join(base_path, "output")
+
+def get_input_directory():
+    return os.path.join(base_path, "input")
+
+def get_full_path(folder_name, filename):
+    path = os.path.join(folder_names_and_paths[folder_name][0][0], filename)
+    return path if os.path.isfile(path) else None
+
+def get_save_image_path(filename_prefix, output_dir, image_width=0, image_height=0):
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir, filename_prefix, 1, "", filename_prefix
@@ -0,0 +1,32 @@
+class BinaryEventTypes:
+    PREVIEW_IMAGE = 1
+    UNENCODED_PREVIEW_IMAGE = 2
+    TEXT = 3
+
+class Routes:
+    def __init__(self):
+        self.handlers = {}
+
+    def post(self, path):
+        def register(func):
+            self.handlers[path] = func
+            return func
+        return register
+
+    def get(self, path):
+        return self.post(path)
+
+class Server:
+    """Records every message sent, as (event, data, sid) in `sent`."""
+    def __init__(self):
+        self.client_id = "test-client"
+        self.last_prompt_id = "test-prompt"
+        self.last_node_id = "9"
+        self.routes = Routes()
+        self.sent = []
+
+    def send_sync(self, event, data, sid=None):
+        self.sent.append((event, data, sid))
+
+class PromptServer:
+    instance = Server()
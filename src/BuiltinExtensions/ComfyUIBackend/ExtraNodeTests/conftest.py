@@ -0,0 +1,6 @@
+# Tests for the Swarm ComfyUI extra nodes. These run against ComfyUI when its folder is on the python path, eg:
+# PYTHONPATH=/path/to/ComfyUI python -m pytest src/BuiltinExtensions/ComfyUIBackend/ExtraNodeTests
+# Without ComfyUI, the minimal stand-ins in 'comfy_stubs' are used for whichever ComfyUI modules can't be found.
+import os, sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "comfy_stubs"))
@@ -0,0 +1,68 @@
+import json, os, torch
+from safetensors.torch import load_file
+from comfy_loader import load_node_module
+
+extract_lora = load_node_module("SwarmComfyCommon", "SwarmExtractLora")
+
+def tensors_for(i):
+    return {f"diffusion_model.key{i}.lora_up.weight": torch.full((4, 2), float(i)), f"diffusion_model.key{i}.lora_down.weight": torch.arange(6, dtype=torch.bfloat16).reshape(2, 3) + i}
+
+def test_writer_resumes_an_interrupted_run(tmp_path):
+    path = str(tmp_path / "out.safetensors")
+    writer = extract_lora.StreamingSafetensorsWriter(path, 4096, {"rank": 4})
+    for i in range(3):
+        writer.add(f"key{i}", tensors_for(i))
+    writer.add("skipped", {})
+    # Interrupted: close() checkpoints the keys done since the last checkpoint
+    writer.close()
+    assert not os.path.exists(path)
+    resumed = extract_lora.StreamingSafetensorsWriter(path, 4096, {"rank": 4})
+    assert resumed.done_keys == {"key0", "key1", "key2", "skipped"}
+    for i in range(3, 5):
+        resumed.add(f"key{i}", tensors_for(i))
+    resumed.finish({"rank": "4"})
+    assert not os.path.exists(f"{path}.partial") and not os.path.exists(f"{path}.partial.json")
+    result = load_file(path)
+    expected = {name: tensor for i in range(5) for name, tensor in tensors_for(i).items()}
+    assert result.keys() == expected.keys()
+    for name, tensor in expected.items():
+        assert result[name].dtype == tensor.dtype and torch.equal(result[name], tensor)
+
+def test_writer_ignores_checkpoints_it_cannot_use(tmp_path):
+    path = str(tmp_path / "out.safetensors")
+    writer = extract_lora.StreamingSafetensorsWriter(path, 4096, {"rank": 4})
+    writer.add("key0", tensors_for(0))
+    writer.close()
+    # Different settings or models start over
+    other = extract_lora.StreamingSafetensorsWriter(path, 4096, {"rank": 8})
+    assert not other.done_keys and other.data_end == 0
+    other.add("key0", tensors_for(0))
+    other.close()
+    # As does a data file shorter than the checkpoint says it is
+    with open(f"{path}.partial", "r+b") as f:
+        f.truncate(100)
+    truncated = extract_lora.StreamingSafetensorsWriter(path, 4096, {"rank": 8})
+    assert not truncated.done_keys
+    truncated.close()
+
+def test_writer_checkpoints_periodically(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_lora, "CHECKPOINT_EVERY_KEYS", 2)
+    path = str(tmp_path / "out.safetensors")
+    writer = extract_lora.StreamingSafetensorsWriter(path, 4096, {"rank": 4})
+    writer.add("key0", tensors_for(0))
+    assert not os.path.exists(f"{path}.partial.json")
+    writer.add("key1", tensors_for(1))
+    with open(f"{path}.partial.json", "r", encoding="utf-8") as f:
+        assert sorted(json.load(f)["done_keys"]) == ["key0", "key1"]
+    writer.close()
+
+def test_writer_moves_data_when_the_header_outgrows_its_reserve(tmp_path):
+    path = str(tmp_path / "out.safetensors")
+    writer = extract_lora.StreamingSafetensorsWriter(path, 8, {"rank": 4})
+    for i in range(3):
+        writer.add(f"key{i}", tensors_for(i))
+    writer.finish({"note": "x" * 1000})
+    result = load_file(path)
+    for i in range(3):
+        for name, tensor in tensors_for(i).items():
+            assert torch.equal(result[name], tensor)
@@ -0,0 +1,31 @@
+import asyncio, json, pytest
+from comfy_loader import load_node_module
+
+input_store = load_node_module("SwarmComfyCommon", "SwarmInputStore")
+
+class JsonRequest:
+    def __init__(self, body: str):
+        self.body = body
+
+    async def json(self):
+        return json.loads(self.body)
+
+def post_exists(body: str):
+    from server import PromptServer
+    return asyncio.run(PromptServer.instance.routes.handlers["/swarm/input_store/exists"](JsonRequest(body)))
+
+def test_exists_lists_present_and_missing_hashes():
+    stored = "a" * 64
+    temp_path = input_store.INPUT_STORE.begin_upload()
+    with open(temp_path, "wb") as f:
+        f.write(b"data")
+    input_store.INPUT_STORE.finish_upload(temp_path, stored, 4)
+    response = post_exists(json.dumps({"hashes": [stored, "b" * 64, "not-a-hash"]}))
+    assert response.status == 200
+    assert response.data == {"present": [stored], "missing": ["b" * 64, "not-a-hash"]}
+
+@pytest.mark.parametrize("body", ["not json", "[]", '{"hashes": "abc"}', '{"hashes": [1, 2]}', '{"hashes": [null]}'])
+def test_exists_rejects_malformed_body(body):
+    response = post_exists(body)
+    assert response.status == 400
+    assert "error" in response.data
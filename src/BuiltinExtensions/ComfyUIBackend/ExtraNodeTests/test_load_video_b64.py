@@ -0,0 +1,44 @@
+import io, math, pytest
+from fractions import Fraction
+av = pytest.importorskip("av")
+import numpy as np
+from comfy_loader import load_node_module
+
+decode_video_window = load_node_module("SwarmComfyCommon", "SwarmLoadImageB64").decode_video_window
+
+SOURCE_FPS = 24
+SOURCE_FRAMES = 48
+# Frames show their index as a row of BITS blocks of BLOCK x BLOCK pixels
+BITS = 6
+BLOCK = 16
+
+def make_video() -> bytes:
+    """Encodes a short clip where each frame shows its own index in binary, as a row of black and white blocks, so decoded frames can be matched back to their source frame."""
+    out = io.BytesIO()
+    with av.open(out, "w", format="mp4") as container:
+        stream = container.add_stream("mpeg4", rate=SOURCE_FPS)
+        stream.width, stream.height, stream.pix_fmt = BITS * BLOCK, BLOCK, "yuv420p"
+        for i in range(SOURCE_FRAMES):
+            pixels = np.zeros((BLOCK, BITS * BLOCK, 3), dtype=np.uint8)
+            for bit in range(BITS):
+                if i & (1 << bit):
+                    pixels[:, bit * BLOCK:(bit + 1) * BLOCK] = 255
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(pixels, format="rgb24")))
+        container.mux(stream.encode())
+    return out.getvalue()
+
+def source_indices(images) -> list:
+    return [sum(1 << bit for bit in range(BITS) if float(image[:, bit * BLOCK:(bit + 1) * BLOCK].mean()) > 0.5) for image in images]
+
+@pytest.mark.parametrize("target_fps", [48, 60, 72])
+def test_decode_video_window_upsamples_to_full_duration(target_fps):
+    images, _, frame_rate = decode_video_window(make_video(), 0, 0, 1, float(target_fps), 0)
+    assert frame_rate == target_fps
+    assert images.shape[0] == SOURCE_FRAMES * target_fps // SOURCE_FPS
+    # Nearest source frame to each output time, with exact ties going to the earlier frame, and times after the last frame taking the last frame
+    assert source_indices(images) == [min(SOURCE_FRAMES - 1, math.ceil(Fraction(i * SOURCE_FPS, target_fps) - Fraction(1, 2))) for i in range(images.shape[0])]
+
+def test_decode_video_window_downsamples_window():
+    images, _, frame_rate = decode_video_window(make_video(), 2, 5, 1, 12.0, 0)
+    assert frame_rate == 12
+    assert source_indices(images) == [4, 6, 8, 10, 12]
@@ -0,0 +1,127 @@
+import gc, json, os, weakref, torch
+from safetensors.torch import save_file
+from comfy_loader import load_node_module
+
+lora_loader = load_node_module("SwarmComfyCommon", "SwarmLoraLoader")
+
+def write_lora(path, numel):
+    save_file({"lora_unet_block.lora_up.weight": torch.ones(numel, dtype=torch.float32)}, str(path))
+    return str(path)
+
+def test_lora_cache_reuses_loads_until_the_file_changes(tmp_path):
+    cache = lora_loader.LoraCache(1024 * 1024)
+    path = write_lora(tmp_path / "a.safetensors", 16)
+    first = cache.load(path)
+    assert cache.load(path) is first
+    assert (cache.hits, cache.misses, cache.total_bytes) == (1, 1, 64)
+    write_lora(path, 32)
+    changed = cache.load(path)
+    assert changed is not first and changed["lora_unet_block.lora_up.weight"].numel() == 32
+    # The older version of the file is dropped rather than kept alongside
+    assert len(cache.entries) == 1 and cache.total_bytes == 128
+
+def test_lora_cache_evicts_least_recently_used_past_budget(tmp_path):
+    cache = lora_loader.LoraCache(150)
+    a, b, c = [write_lora(tmp_path / f"{name}.safetensors", 16) for name in "abc"]
+    cache.load(a)
+    cache.load(b)
+    cache.load(a)
+    cache.load(c)
+    assert [key[0] for key in cache.entries] == [a, c]
+    assert cache.evictions == 1 and cache.total_bytes == 128
+    # Files bigger than the whole budget are returned but not kept
+    big = write_lora(tmp_path / "big.safetensors", 100)
+    assert cache.load(big)["lora_unet_block.lora_up.weight"].numel() == 100
+    assert big not in [key[0] for key in cache.entries]
+    cache.set_budget(0)
+    assert not cache.entries and cache.total_bytes == 0
+
+class Base:
+    """Stands in for a base model or clip, which must be weak-referenceable."""
+
+def test_patched_model_cache_limits_and_base_lifetime(tmp_path):
+    cache = lora_loader.PatchedModelCache(2, 1000)
+    path = write_lora(tmp_path / "a.safetensors", 16)
+    model, clip = Base(), Base()
+    keys = [cache.make_key(model, clip, [(path, weight)]) for weight in (0.5, 1.0, 1.5)]
+    for i, key in enumerate(keys):
+        cache.put(key, model, clip, (f"model{i}", f"clip{i}"), 100)
+    # Only max_entries are kept, least recently used dropped first
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == ("model2", "clip2")
+    cache.put(cache.make_key(model, clip, [(path, 2.0)]), model, clip, ("model3", "clip3"), 950)
+    assert list(cache.entries) == [cache.make_key(model, clip, [(path, 2.0)])] and cache.total_bytes == 950
+    # Entries over the whole budget aren't kept at all
+    cache.put(keys[0], model, clip, ("huge", "huge"), 1001)
+    assert cache.get(keys[0]) is None
+    # A changed LoRA file makes a different key
+    write_lora(path, 32)
+    assert cache.make_key(model, clip, [(path, 2.0)]) not in cache.entries
+    # Entries go away with their base model
+    del model
+    gc.collect()
+    assert not cache.entries and cache.total_bytes == 0
+
+def test_unloading_all_models_clears_patched_models():
+    import comfy.model_management
+    assert comfy.model_management.unload_all_models.swarm_hooked
+    lora_loader.PATCHED_MODEL_CACHE.put(("key",), None, None, ("model", "clip"), 1)
+    comfy.model_management.unload_all_models()
+    assert not lora_loader.PATCHED_MODEL_CACHE.entries
+
+class Patched(Base):
+    def __init__(self, base, weight):
+        self.applied = getattr(base, "applied", []) + [weight]
+
+def test_lora_loader_reuses_patched_models(monkeypatch):
+    import comfy.sd, folder_paths
+    lora_dir = folder_paths.folder_names_and_paths["loras"][0][0]
+    os.makedirs(lora_dir, exist_ok=True)
+    write_lora(os.path.join(lora_dir, "one.safetensors"), 16)
+    write_lora(os.path.join(lora_dir, "two.safetensors"), 16)
+    applied = []
+    def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
+        applied.append(strength_model)
+        return (Patched(model, strength_model), Patched(clip, strength_clip))
+    monkeypatch.setattr(comfy.sd, "load_lora_for_models", load_lora_for_models)
+    model, clip = Base(), Base()
+    node = lora_loader.SwarmLoraLoader()
+    result = node.load_loras(model, clip, "one.safetensors, two.safetensors, one.safetensors", "0.5, 0, 1.5")
+    # Zero weight LoRAs are skipped, and the rest applied in order
+    assert applied == [0.5, 1.5]
+    assert result[0].applied == [0.5, 1.5] and result[1].applied == [0.5, 1.5]
+    cached = node.load_loras(model, clip, "one.safetensors, two.safetensors, one.safetensors", "0.5, 0, 1.5")
+    assert cached[0] is result[0] and cached[1] is result[1]
+    assert applied == [0.5, 1.5]
+    assert node.load_loras(model, clip, "", "") == (model, clip)
+
+def test_key_maps_are_built_once_per_structure_and_saved(monkeypatch):
+    monkeypatch.setattr(lora_loader, "KEY_MAP_CACHE", weakref.WeakKeyDictionary())
+    monkeypatch.setattr(lora_loader, "KEY_MAP_BY_SIGNATURE", {})
+    built = []
+    def builder(module, key_map):
+        built.append(module)
+        key_map.update({"lora_unet_0": "0.weight", "diffusion_model.0": ("diffusion_model", "0.weight")})
+        return key_map
+    first, same_shape = torch.nn.Sequential(torch.nn.Linear(4, 4)), torch.nn.Sequential(torch.nn.Linear(4, 4))
+    key_map = lora_loader.cached_key_map(first, "unet", builder)
+    assert lora_loader.cached_key_map(first, "unet", builder) is key_map
+    assert lora_loader.cached_key_map(same_shape, "unet", builder) is key_map
+    assert built == [first]
+    # Saved to disk, tuples included, and used after a restart
+    monkeypatch.setattr(lora_loader, "KEY_MAP_CACHE", weakref.WeakKeyDictionary())
+    monkeypatch.setattr(lora_loader, "KEY_MAP_BY_SIGNATURE", {})
+    assert lora_loader.cached_key_map(same_shape, "unet", builder) == {"lora_unet_0": "0.weight", "diffusion_model.0": ("diffusion_model", "0.weight")}
+    assert built == [first]
+    # A different structure, or the other kind of module, gets its own map
+    lora_loader.cached_key_map(torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.Linear(8, 4)), "unet", builder)
+    lora_loader.cached_key_map(first, "clip", builder)
+    assert len(built) == 3
+
+def test_comfy_key_map_functions_are_cached():
+    import comfy.lora
+    assert comfy.lora.model_lora_keys_unet.swarm_cached and comfy.lora.model_lora_keys_clip.swarm_cached
+    module = torch.nn.Sequential(torch.nn.Linear(2, 2))
+    key_map = {"existing": "key"}
+    assert comfy.lora.model_lora_keys_unet(module, key_map) is key_map
+    assert key_map["existing"] == "key" and len(key_map) > 1
@@ -0,0 +1,38 @@
+import os, sys
+from comfy_loader import EXTRA_NODES_DIR, comfy_package_name, load_node_module
+
+def test_animation_node_uses_common_module_loaded_by_comfy():
+    # Comfy loads SwarmComfyCommon (whose __init__ imports SwarmSaveImageWS) and SwarmComfyExtra in no particular order, so load Extra first
+    path_before = list(sys.path)
+    animation = load_node_module("SwarmComfyExtra", "SwarmSaveAnimationWS")
+    save_image_ws = load_node_module("SwarmComfyCommon", "SwarmSaveImageWS")
+    assert animation.save_image_ws() is save_image_ws
+    assert save_image_ws.__name__ == f"{comfy_package_name('SwarmComfyCommon')}.SwarmSaveImageWS"
+    # No second copy of the package loaded under its bare name, nor through a sys.path entry
+    assert "SwarmComfyCommon" not in sys.modules
+    assert sys.path == path_before and EXTRA_NODES_DIR not in sys.path
+    copies = [name for name, module in list(sys.modules.items()) if os.path.realpath(getattr(module, "__file__", None) or "") == animation.SAVE_IMAGE_WS_PATH]
+    assert copies == [save_image_ws.__name__]
+
+def test_image_and_animation_saves_share_one_async_encoder():
+    import json, struct, threading, torch
+    from server import PromptServer
+    save_image_ws = load_node_module("SwarmComfyCommon", "SwarmSaveImageWS")
+    animation = load_node_module("SwarmComfyExtra", "SwarmSaveAnimationWS")
+    assert animation.save_image_ws().ASYNC_ENCODER is save_image_ws.ASYNC_ENCODER
+    server = PromptServer.instance
+    server.sent.clear()
+    images = torch.rand(3, 16, 16, 3)
+    save_image_ws.SwarmSaveImageWS().save_images(images[:1], async_encode=True)
+    animation.SwarmSaveAnimationWS().save_images(images, 6.0, True, 80, "fastest", "webp", async_encode=True)
+    encoder = save_image_ws.ASYNC_ENCODER
+    with encoder.condition:
+        assert encoder.condition.wait_for(lambda: encoder.queued_bytes == 0 and encoder.jobs.empty(), timeout=30)
+    assert [thread.name for thread in threading.enumerate()].count("SwarmAsyncOutputEncoder") == 1
+    # Outputs arrive in submission order, the image before the animation
+    mime_types = []
+    for event, data, _ in server.sent:
+        if event == 9999123:
+            meta_length = struct.unpack(">I", data[:4])[0]
+            mime_types.append(json.loads(data[4:4 + meta_length])["mime_type"])
+    assert mime_types == ["image/png", "image/webp"]
@@ -0,0 +1,118 @@
+import io, json, struct, pytest, torch
+from comfy_loader import load_node_module
+
+animation = load_node_module("SwarmComfyExtra", "SwarmSaveAnimationWS")
+
+def sent_outputs():
+    """Pops the (meta, data) of every output message sent to the stub server so far, meta being just the type number for plain outputs."""
+    from server import BinaryEventTypes, PromptServer
+    outputs = []
+    for event, data, _ in PromptServer.instance.sent:
+        if event == BinaryEventTypes.PREVIEW_IMAGE:
+            outputs.append(({"type_num": struct.unpack(">I", data[:4])[0]}, bytes(data[4:])))
+        elif event == 9999123:
+            meta_length = struct.unpack(">I", data[:4])[0]
+            outputs.append((json.loads(data[4:4 + meta_length]), bytes(data[4 + meta_length:])))
+    PromptServer.instance.sent.clear()
+    return outputs
+
+def mp4_boxes(data):
+    """Lists the types of the top-level boxes of an mp4 file."""
+    boxes = []
+    pos = 0
+    while pos + 8 <= len(data):
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        boxes.append(kind.decode("ascii"))
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+        pos += size
+    return boxes
+
+def save(format, **kwargs):
+    sent_outputs()
+    images = torch.rand(12, 32, 48, 3)
+    animation.SwarmSaveAnimationWS().save_images(images, 12.0, False, 80, "fastest", format, **kwargs)
+    return sent_outputs()
+
+def test_mp4_is_a_regular_faststart_file_unless_streamed():
+    (meta, data), = save("h264-mp4")
+    assert meta["type_num"] == 5
+    boxes = mp4_boxes(data)
+    assert "moof" not in boxes
+    assert boxes.index("moov") < boxes.index("mdat")
+
+def test_streamed_mp4_is_fragmented_and_pieced_in_order():
+    outputs = save("h264-mp4", stream_output=True)
+    assert [meta["stream_seq"] for meta, _ in outputs] == list(range(len(outputs)))
+    assert len({meta["stream_id"] for meta, _ in outputs}) == 1
+    assert outputs[-1][0].get("stream_final") and not any(meta.get("stream_final") for meta, _ in outputs[:-1])
+    boxes = mp4_boxes(b"".join(data for _, data in outputs))
+    assert "moof" in boxes and boxes.index("moov") < boxes.index("moof")
+
+@pytest.mark.parametrize("format", ["webm", "gif-hd"])
+def test_piped_formats_are_sent_whole(format):
+    (meta, data), = save(format)
+    assert len(data) > 0 and "stream_id" not in meta
+
+def test_previews_match_swarm_ffmpeg_previews():
+    from PIL import Image
+    (meta, data), = save("webm", preview=True)
+    webp_length = meta["preview_webp_length"]
+    jpg_length = meta["preview_jpg_length"]
+    jpg = Image.open(io.BytesIO(data[-webp_length - jpg_length:-webp_length]))
+    webp = Image.open(io.BytesIO(data[-webp_length:]))
+    # Full resolution first frame, and an animation scaled to 128 high like ffmpeg's 'fps=fps=6,scale=-1:128'
+    assert jpg.size == (48, 32)
+    assert webp.size == (192, 128)
+    assert webp.n_frames == 6 # 1 second of 12 fps input at 6 fps
+
+def test_gif_fade_keeps_every_frame():
+    import numpy as np
+    from PIL import Image
+    sent_outputs()
+    # A slow fade of one flat color, the worst case for a shared palette without dithering
+    levels = torch.linspace(0, 1, 150)[:, None, None, None] * torch.tensor([1.0, 0.7, 0.35])
+    animation.SwarmSaveAnimationWS().save_images(levels.expand(150, 32, 48, 3), 25.0, False, 80, "default", "gif")
+    (_, data), = sent_outputs()
+    gif = Image.open(io.BytesIO(data))
+    assert gif.n_frames == 150
+    means = []
+    for i in range(gif.n_frames):
+        gif.seek(i)
+        means.append(np.asarray(gif.convert("RGB"), dtype=np.float64).mean(axis=(0, 1)))
+    expected = (levels[:, 0, 0].numpy() * 255).astype(np.float64)
+    assert np.abs(np.array(means) - expected).mean() < 2
+
+def ffmpeg_rawvideo_args(frames):
+    return [animation.FFMPEG_PATH, "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{frames.shape[2]}x{frames.shape[1]}", "-r", "12", "-i", "-", "-n"]
+
+def test_run_ffmpeg_feeds_and_pipes_in_pieces(monkeypatch):
+    # Small feed and output pieces, so that a short clip goes through both in many chunks
+    monkeypatch.setattr(animation, "FFMPEG_FEED_CHUNK_BYTES", 5000)
+    monkeypatch.setattr(animation, "STREAM_CHUNK_BYTES", 3000)
+    frames = torch.rand(7, 32, 48, 3)
+    expected = animation.save_image_ws().images_to_numpy(frames).tobytes()
+    result = animation.run_ffmpeg(ffmpeg_rawvideo_args(frames), ["-f", "rawvideo", "-pix_fmt", "rgb24", "-"], frames)
+    assert result.returncode == 0 and result.stdout == expected
+    pieces = []
+    result = animation.run_ffmpeg(ffmpeg_rawvideo_args(frames), ["-f", "rawvideo", "-pix_fmt", "rgb24", "-"], frames, on_output=pieces.append)
+    assert result.returncode == 0 and result.stdout == b""
+    assert len(pieces) > 1 and max(len(piece) for piece in pieces) <= 3000
+    assert b"".join(pieces) == expected
+
+def test_run_ffmpeg_raises_output_handler_errors():
+    frames = torch.rand(3, 16, 16, 3)
+    def on_output(data):
+        raise ValueError("client went away")
+    with pytest.raises(ValueError, match="client went away"):
+        animation.run_ffmpeg(ffmpeg_rawvideo_args(frames), ["-f", "rawvideo", "-pix_fmt", "rgb24", "-"], frames, on_output=on_output)
+
+def test_mp4_with_audio_has_both_streams():
+    av = pytest.importorskip("av")
+    audio = {"waveform": torch.sin(torch.linspace(0, 2000, 44100))[None, None, :].repeat(1, 2, 1), "sample_rate": 44100}
+    (meta, data), = save("h264-mp4", audio=audio)
+    with av.open(io.BytesIO(data)) as container:
+        assert [stream.type for stream in container.streams] == ["video", "audio"]
+        assert container.streams.audio[0].channels == 2
+        # Audio is trimmed to the video's length (12 frames at 12 fps)
+        assert abs(float(container.duration / av.time_base) - 1.0) < 0.1
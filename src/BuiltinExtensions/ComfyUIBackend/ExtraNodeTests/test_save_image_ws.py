@@ -0,0 +1,28 @@
+import io, pytest
+from PIL import Image
+from comfy_loader import load_node_module
+
+save_image_ws = load_node_module("SwarmComfyCommon", "SwarmSaveImageWS")
+SwarmSaveImageWS, EXIF_IFD, EXIF_USER_COMMENT = save_image_ws.SwarmSaveImageWS, save_image_ws.EXIF_IFD, save_image_ws.EXIF_USER_COMMENT
+
+METADATA = '{"sui_image_params": {"prompt": "a photo of a cat ✓"}}'
+
+@pytest.mark.parametrize("format", ["jpg", "webp", "webp_lossless"])
+def test_encode_image_writes_user_comment_to_exif_ifd(format):
+    img = Image.new("RGB", (16, 16), (10, 20, 30))
+    _, do_save = SwarmSaveImageWS().encode_image(img, format, 90, METADATA)
+    out = io.BytesIO()
+    do_save(out)
+    out.seek(0)
+    exif = Image.open(out).getexif()
+    assert EXIF_USER_COMMENT not in exif
+    assert exif.get_ifd(EXIF_IFD)[EXIF_USER_COMMENT] == b"UNICODE\0" + METADATA.encode("utf-16-le")
+
+def test_encode_image_writes_png_parameters():
+    img = Image.new("RGB", (16, 16), (10, 20, 30))
+    type_num, do_save = SwarmSaveImageWS().encode_image(img, "png", 90, METADATA)
+    out = io.BytesIO()
+    do_save(out)
+    out.seek(0)
+    assert type_num == 2
+    assert Image.open(out).text["parameters"] == METADATA
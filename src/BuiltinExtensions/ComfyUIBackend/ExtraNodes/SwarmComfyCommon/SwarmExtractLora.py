@@ -1,11 +1,21 @@
 import comfy.model_management
-import safetensors.torch
-import torch, os, comfy, json
+import torch, os, comfy, json, math, time, collections, collections.abc, concurrent.futures
+from safetensors import safe_open
 
 # ATTRIBUTION: This code is a mix of code from kohya-ss, comfy, and Swarm. It would be annoying to disentangle but it's all FOSS and relatively short so it's fine.
 
 CLAMP_QUANTILE = 0.99
-def extract_lora(diff, rank):
+# Max error (as a fraction of rank) allowed for the estimated clamp quantile, at about 3 standard deviations
+CLAMP_QUANTILE_TOLERANCE = 0.001
+# Randomized solver settings, see torch.svd_lowrank
+LOWRANK_OVERSAMPLE = 10
+LOWRANK_POWER_ITERATIONS = 2
+# Max number of keys being prepared (or on CPU, fully processed) ahead at once, and max bytes of tensors held by them
+PREFETCH_KEYS = 4
+PREFETCH_MEMORY_BUDGET = 4 * 1024 * 1024 * 1024
+
+def extract_lora(diff, rank, solver="exact", energy_target=None, min_rank=1):
+    """Extracts (up, down) LoRA weights from a diff. With an energy_target, 'rank' is the max rank, and the actual rank is the smallest one that keeps that fraction of the diff's energy (sum of squared singular values), but at least min_rank."""
     conv2d = (len(diff.shape) == 4)
     kernel_size = None if not conv2d else diff.size()[2:4]
     conv2d_3x3 = conv2d and kernel_size != (1, 1)
@@ -18,14 +28,24 @@ def extract_lora(diff, rank):
         else:
             diff = diff.squeeze()
 
-    U, S, Vh = torch.linalg.svd(diff.float(), full_matrices=False)
+    q = rank + LOWRANK_OVERSAMPLE
+    if solver == "randomized" and q < min(diff.shape):
+        U, S, V = torch.svd_lowrank(diff.float(), q=q, niter=LOWRANK_POWER_ITERATIONS)
+        Vh = V.T
+    else:
+        U, S, Vh = torch.linalg.svd(diff.float(), full_matrices=False)
+    if energy_target is not None:
+        # Total energy is the squared Frobenius norm, which is also right when the randomized solver only found the top singular values
+        kept = torch.cumsum(S.float().square(), dim=0) / diff.float().square().sum().clamp(min=1e-30)
+        needed = int((kept < energy_target).sum()) + 1
+        rank = max(min(min_rank, rank), min(needed, rank))
     U = U[:, :rank]
     S = S[:rank]
     U = U @ torch.diag(S)
     Vh = Vh[:rank, :]
 
     dist = torch.cat([U.flatten(), Vh.flatten()])
-    hi_val = torch.quantile(dist, CLAMP_QUANTILE)
+    hi_val = approximate_quantile(dist, CLAMP_QUANTILE, CLAMP_QUANTILE_TOLERANCE)
     low_val = -hi_val
 
     U = U.clamp(low_val, hi_val)
@@ -35,70 +55,334 @@ def extract_lora(diff, rank):
         Vh = Vh.reshape(rank, in_dim, kernel_size[0], kernel_size[1])
     return (U, Vh)
 
+def approximate_quantile(values, q, tolerance):
+    """Estimates the q quantile of a 1D tensor, using kthvalue (a selection rather than a full sort), on a fixed-seed random sample when the input is larger than needed to be accurate within the tolerance."""
+    sample_size = math.ceil(q * (1 - q) / (tolerance / 3) ** 2)
+    if values.numel() > sample_size:
+        generator = torch.Generator(device=values.device).manual_seed(0)
+        values = values[torch.randint(0, values.numel(), (sample_size,), generator=generator, device=values.device)]
+    k = min(values.numel(), max(1, math.ceil(q * values.numel())))
+    return values.kthvalue(k).values
 
-def do_lora_handle(base_data, other_data, rank, callback):
-    out_data = {}
-    device = comfy.model_management.get_torch_device()
-    for key in base_data.keys():
-        callback()
-        if key not in other_data:
-            print(f"discard key in base but not in other: {key}")
-            continue
-        if key.endswith(".weight_scale") or key.endswith(".comfy_quant"):
-            continue
-        base_tensor = base_data[key]
-        other_tensor = other_data[key]
+def reconstruction_error(diff, up, down):
+    """Relative (Frobenius norm) error of the up @ down reconstruction of a diff."""
+    diff = diff.float().reshape(diff.shape[0], -1)
+    rebuilt = up.float().reshape(up.shape[0], -1) @ down.float().reshape(down.shape[0], -1)
+    return float(torch.linalg.matrix_norm(diff - rebuilt) / torch.linalg.matrix_norm(diff).clamp(min=1e-12))
+
+
+def prepare_key(key, base_data, other_data):
+    """Looks up, dequantizes and dtype-matches the base and other tensors for one key. Returns (key, fixed_key, target_dtype, base_tensor, other_tensor), or None if the key is skipped."""
+    if key not in other_data:
+        print(f"discard key in base but not in other: {key}")
+        return None
+    if key.endswith(".weight_scale") or key.endswith(".comfy_quant"):
+        return None
+    base_tensor = base_data[key]
+    other_tensor = other_data[key]
+    fixed_key = key
+    if key.endswith(".weight"):
+        fixed_key = key[:-len(".weight")]
+        scale_key = f"{fixed_key}.weight_scale"
+        if scale_key in base_data:
+            scale = base_data[scale_key]
+            base_tensor = base_tensor.to(dtype=torch.bfloat16) * scale
+        if scale_key in other_data:
+            scale = other_data[scale_key]
+            other_tensor = other_tensor.to(dtype=torch.bfloat16) * scale
+    elif key.endswith(".bias") or key.endswith(".scale") or key.endswith(".lin"):
         fixed_key = key
-        if key.endswith(".weight"):
-            fixed_key = key[:-len(".weight")]
-            scale_key = f"{fixed_key}.weight_scale"
-            if scale_key in base_data:
-                scale = base_data[scale_key]
-                base_tensor = base_tensor.to(dtype=torch.bfloat16) * scale
-            if scale_key in other_data:
-                scale = other_data[scale_key]
-                other_tensor = other_tensor.to(dtype=torch.bfloat16) * scale
-        elif key.endswith(".bias") or key.endswith(".scale") or key.endswith(".lin"):
-            fixed_key = key
-        if base_tensor.shape != other_tensor.shape:
-            print(f"discard mismatched shapes {base_tensor.shape} != {other_tensor.shape}")
-            continue
-        target_dtype = base_tensor.dtype
-        if target_dtype == torch.float8_e4m3fn or target_dtype == torch.float8_e5m2:
-            target_dtype = torch.bfloat16
-        base_tensor = base_tensor.to(dtype=target_dtype)
-        other_tensor = other_tensor.to(dtype=target_dtype)
-        diff = other_tensor.to(device, dtype=torch.float32) - base_tensor.to(device, dtype=torch.float32)
-        other_tensor = other_tensor.cpu()
-        base_tensor = base_tensor.cpu()
-        max_diff = float(diff.abs().max())
-        if max_diff < 1e-4:
-            print(f"discard unaltered key {key} ({max_diff})")
-            continue
-        if len(base_tensor.shape) >= 2 and base_tensor.numel() > 1024:
-            print(f"extract key {key} (shape={base_tensor.shape}, maxdiff={max_diff}, numel={base_tensor.numel()})")
-            out = extract_lora(diff, rank)
-            up = out[0].contiguous().to(dtype=target_dtype).cpu()
-            down = out[1].contiguous().to(dtype=target_dtype).cpu()
-            if up.isnan().any() or up.isinf().any():
-                print(f"bad data for {key}.lora_up.weight")
-                continue
-            if down.isnan().any() or down.isinf().any():
-                print(f"bad data for {key}.lora_down.weight")
-                continue
-            out_data[f"diffusion_model.{fixed_key}.lora_up.weight"] = up
-            out_data[f"diffusion_model.{fixed_key}.lora_down.weight"] = down
+    if base_tensor.shape != other_tensor.shape:
+        print(f"discard mismatched shapes {base_tensor.shape} != {other_tensor.shape}")
+        return None
+    target_dtype = base_tensor.dtype
+    if target_dtype == torch.float8_e4m3fn or target_dtype == torch.float8_e5m2:
+        target_dtype = torch.bfloat16
+    base_tensor = base_tensor.to(dtype=target_dtype)
+    other_tensor = other_tensor.to(dtype=target_dtype)
+    return (key, fixed_key, target_dtype, base_tensor, other_tensor)
+
+def handle_key(prepared, device, rank, solver, energy_target=None, min_rank=1):
+    """Diffs and extracts one prepared key. Returns (key, output tensors dict, reconstruction error or None)."""
+    key, fixed_key, target_dtype, base_tensor, other_tensor = prepared
+    if base_tensor.device != other_tensor.device:
+        # Can't compare across devices, so move both over first
+        base_tensor, other_tensor = base_tensor.to(device), other_tensor.to(device)
+    if torch.equal(base_tensor, other_tensor):
+        # Cheap exit for untouched layers, before any dtype conversion (and when both are already on the same device, before any transfer)
+        print(f"discard unaltered key {key} (0.0)")
+        return (key, {}, None)
+    diff = other_tensor.to(device, dtype=torch.float32) - base_tensor.to(device, dtype=torch.float32)
+    max_diff = float(diff.abs().max())
+    if max_diff < 1e-4:
+        print(f"discard unaltered key {key} ({max_diff})")
+        return (key, {}, None)
+    if len(base_tensor.shape) >= 2 and base_tensor.numel() > 1024:
+        print(f"extract key {key} (shape={base_tensor.shape}, maxdiff={max_diff}, numel={base_tensor.numel()})")
+        out = extract_lora(diff, rank, solver, energy_target, min_rank)
+        error = reconstruction_error(diff, out[0], out[1])
+        print(f"reconstruction error for {key}: {error:.6f}")
+        up = out[0].contiguous().to(dtype=target_dtype).cpu()
+        down = out[1].contiguous().to(dtype=target_dtype).cpu()
+        if up.isnan().any() or up.isinf().any():
+            print(f"bad data for {key}.lora_up.weight")
+            return (key, {}, None)
+        if down.isnan().any() or down.isinf().any():
+            print(f"bad data for {key}.lora_down.weight")
+            return (key, {}, None)
+        return (key, {f"diffusion_model.{fixed_key}.lora_up.weight": up, f"diffusion_model.{fixed_key}.lora_down.weight": down}, error)
+    print(f"simple diff key {key} (shape={base_tensor.shape}, maxdiff={max_diff}, numel={base_tensor.numel()})")
+    out = diff.contiguous().to(dtype=target_dtype).cpu()
+    if out.isnan().any() or out.isinf().any():
+        print(f"bad data for {key}")
+        return (key, {}, None)
+    return (key, {f"diffusion_model.{fixed_key}.diff": out}, None)
+
+
+SAFETENSORS_DTYPES = {torch.float64: "F64", torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16", torch.float8_e4m3fn: "F8_E4M3", torch.float8_e5m2: "F8_E5M2"}
+# Extra header space reserved for metadata added after extraction starts
+HEADER_RESERVE_MARGIN = 64 * 1024
+# The resume checkpoint is rewritten after this many finished keys or this many seconds, whichever comes first, and when the writer is closed
+CHECKPOINT_EVERY_KEYS = 32
+CHECKPOINT_INTERVAL_SECONDS = 10.0
+
+class StreamingSafetensorsWriter:
+    """Writes a safetensors file incrementally. Tensor data is streamed to '{path}.partial' behind reserved header space as each key finishes, completed keys are periodically checkpointed in '{path}.partial.json' so that an interrupted run can resume, and finish() fills in the header and moves the file into place."""
+    def __init__(self, path, header_reserve, resume_info):
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.checkpoint_path = f"{path}.partial.json"
+        self.resume_info = resume_info
+        self.tensors = {}
+        self.done_keys = set()
+        self.data_end = 0
+        self.header_reserve = (header_reserve + 7) // 8 * 8
+        checkpoint = self.load_checkpoint()
+        if checkpoint is not None:
+            self.header_reserve = checkpoint["header_reserve"]
+            self.tensors = checkpoint["tensors"]
+            self.done_keys = set(checkpoint["done_keys"])
+            self.data_end = checkpoint["data_end"]
+            print(f"resuming extraction into {self.partial_path} with {len(self.done_keys)} keys already done")
+            self.file = open(self.partial_path, "r+b")
+        else:
+            self.file = open(self.partial_path, "w+b")
+        self.file.truncate(8 + self.header_reserve + self.data_end)
+        self.file.seek(8 + self.header_reserve + self.data_end)
+        self.unsaved_keys = 0
+        self.last_checkpoint = time.monotonic()
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path) or not os.path.exists(self.partial_path):
+            return None
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ignoring unreadable extraction checkpoint {self.checkpoint_path}: {e}")
+            return None
+        if checkpoint.get("resume_info") != self.resume_info:
+            print(f"ignoring extraction checkpoint {self.checkpoint_path} from a run with different settings or models")
+            return None
+        if os.path.getsize(self.partial_path) < 8 + checkpoint["header_reserve"] + checkpoint["data_end"]:
+            print(f"ignoring extraction checkpoint {self.checkpoint_path} as its data file is incomplete")
+            return None
+        return checkpoint
+
+    def add(self, source_key, tensors):
+        """Appends the output tensors for one finished source key (which may be none, for skipped keys), checkpointing once enough keys or time have built up."""
+        for name, tensor in tensors.items():
+            data = tensor.contiguous().reshape(-1).view(torch.uint8).numpy()
+            self.file.write(memoryview(data))
+            self.tensors[name] = {"dtype": SAFETENSORS_DTYPES[tensor.dtype], "shape": list(tensor.shape), "data_offsets": [self.data_end, self.data_end + data.nbytes]}
+            self.data_end += data.nbytes
+        self.done_keys.add(source_key)
+        self.unsaved_keys += 1
+        if self.unsaved_keys >= CHECKPOINT_EVERY_KEYS or time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL_SECONDS:
+            self.save_checkpoint()
+
+    def save_checkpoint(self):
+        """Syncs the written data to disk, then atomically replaces the checkpoint, so that a checkpoint never refers to data that could be lost in a crash."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        with open(f"{self.checkpoint_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"resume_info": self.resume_info, "header_reserve": self.header_reserve, "data_end": self.data_end, "tensors": self.tensors, "done_keys": sorted(self.done_keys)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
+        self.unsaved_keys = 0
+        self.last_checkpoint = time.monotonic()
+
+    def finish(self, metadata):
+        header = json.dumps({"__metadata__": metadata, **self.tensors}, separators=(",", ":")).encode("utf-8")
+        if len(header) > self.header_reserve:
+            # Didn't fit in the reserved space, so copy the data behind a larger header
+            header_size = (len(header) + 7) // 8 * 8
+            with open(f"{self.partial_path}.tmp", "wb") as out:
+                out.write(header_size.to_bytes(8, "little"))
+                out.write(header.ljust(header_size, b" "))
+                self.file.seek(8 + self.header_reserve)
+                while chunk := self.file.read(64 * 1024 * 1024):
+                    out.write(chunk)
+            self.file.close()
+            os.replace(f"{self.partial_path}.tmp", self.partial_path)
         else:
-            print(f"simple diff key {key} (shape={base_tensor.shape}, maxdiff={max_diff}, numel={base_tensor.numel()})")
-            out = diff.contiguous().to(dtype=target_dtype).cpu()
-            if out.isnan().any() or out.isinf().any():
-                print(f"bad data for {key}")
-                continue
-            out_data[f"diffusion_model.{fixed_key}.diff"] = out
+            self.file.seek(0)
+            self.file.write(self.header_reserve.to_bytes(8, "little"))
+            self.file.write(header.ljust(self.header_reserve, b" "))
+            self.file.close()
+        os.replace(self.partial_path, self.path)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def close(self):
+        """Closes the file if finish() wasn't reached (eg on interrupt), checkpointing any keys done since the last checkpoint first."""
+        if not self.file.closed:
+            if self.unsaved_keys > 0:
+                try:
+                    self.save_checkpoint()
+                except OSError as e:
+                    print(f"failed to save extraction checkpoint {self.checkpoint_path}: {e}")
+            self.file.close()
 
 
+def do_lora_handle(base_data, other_data, rank, callback, solver="exact", writer=None, energy_target=None, min_rank=1):
+    """Extracts all keys, returning the output tensors, or if a StreamingSafetensorsWriter is given, handing them to it as each key finishes (and skipping keys it already has)."""
+    out_data = {}
+    errors = {}
+    device = comfy.model_management.get_torch_device()
+    # On CPU, whole keys are spread across the pool. Otherwise the pool prepares upcoming keys while the device works through them in order.
+    parallel = device.type == "cpu"
+    workers = max(1, min(PREFETCH_KEYS, os.cpu_count() or 1))
+    def work(key):
+        prepared = prepare_key(key, base_data, other_data)
+        if prepared is None or not parallel:
+            return prepared
+        return handle_key(prepared, device, rank, solver, energy_target, min_rank)
+    def estimate_bytes(key):
+        # Both tensors, at their current size or as bf16 after dequantizing
+        numel, element_size = base_data.tensor_size(key) if isinstance(base_data, SafetensorsFileDict) else (base_data[key].numel(), base_data[key].element_size())
+        return 2 * numel * max(2, element_size)
+    keys = list(base_data.keys())
+    if writer is not None:
+        for _ in range(len([key for key in keys if key in writer.done_keys])):
+            callback()
+        keys = [key for key in keys if key not in writer.done_keys]
+    next_index = 0
+    pending = collections.deque()
+    in_flight_bytes = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while next_index < len(keys) or pending:
+            while next_index < len(keys) and len(pending) < workers:
+                size = estimate_bytes(keys[next_index])
+                if pending and in_flight_bytes + size > PREFETCH_MEMORY_BUDGET:
+                    break
+                pending.append((keys[next_index], pool.submit(work, keys[next_index]), size))
+                in_flight_bytes += size
+                next_index += 1
+            key, future, size = pending.popleft()
+            result = future.result()
+            in_flight_bytes -= size
+            entries, error = {}, None
+            if result is not None:
+                if not parallel:
+                    result = handle_key(result, device, rank, solver, energy_target, min_rank)
+                _, entries, error = result
+            if writer is not None:
+                writer.add(key, entries)
+            else:
+                out_data.update(entries)
+            if error is not None:
+                errors[key] = error
+            callback()
+
+    if errors:
+        worst = max(errors, key=errors.get)
+        print(f"{solver} solver relative reconstruction error over {len(errors)} keys: mean {sum(errors.values()) / len(errors):.6f}, max {errors[worst]:.6f} ({worst})")
     return out_data
 
+SAFETENSORS_ELEMENT_SIZES = {"F64": 8, "F32": 4, "F16": 2, "BF16": 2, "F8_E4M3": 1, "F8_E5M2": 1, "I64": 8, "I32": 4, "I16": 2, "I8": 1, "U8": 1, "BOOL": 1}
+
+class SafetensorsFileDict(collections.abc.Mapping):
+    """Read-only dict view of an open (memory-mapped) safetensors file, loading each tensor only when it is accessed.
+    If the file is a full checkpoint, only its diffusion model keys are included, with the same prefix cleanup as model state dicts get."""
+    def __init__(self, file):
+        self.file = file
+        keys = list(file.keys())
+        prefix = "model.diffusion_model."
+        if any(k.startswith(prefix) for k in keys):
+            self.key_map = {k[len(prefix):]: k for k in keys if k.startswith(prefix)}
+        else:
+            self.key_map = {clean_state_dict_key(k): k for k in keys}
+
+    def __getitem__(self, key):
+        return self.file.get_tensor(self.key_map[key])
+
+    def __contains__(self, key):
+        return key in self.key_map
+
+    def __iter__(self):
+        return iter(self.key_map)
+
+    def __len__(self):
+        return len(self.key_map)
+
+    def tensor_size(self, key):
+        """Returns (numel, element_size) without loading the tensor."""
+        tensor_slice = self.file.get_slice(self.key_map[key])
+        return math.prod(tensor_slice.get_shape()), SAFETENSORS_ELEMENT_SIZES.get(tensor_slice.get_dtype(), 4)
+
+def clean_state_dict_key(k):
+    if k.startswith("model."):
+        k = k[len("model."):]
+    if k.startswith("diffusion_model."):
+        k = k[len("diffusion_model."):]
+    return k
+
+def extract_and_save(base_data, other_data, rank, save_rawpath, save_filename, metadata, solver, rank_mode="fixed", energy_target=0.9, min_rank=1):
+    key_count = len(base_data.keys())
+    pbar = comfy.utils.ProgressBar(key_count)
+    class Helper:
+        steps = 0
+        def callback(self):
+            self.steps += 1
+            pbar.update_absolute(self.steps, key_count, None)
+    helper = Helper()
+
+    # Can't easily autodetect all the correct modelspec info, but at least supply some basics
+    out_metadata = {
+        "modelspec.title": f"(Extracted LoRA) {save_filename}",
+        "modelspec.description": f"LoRA extracted in SwarmUI"
+    }
+    if metadata:
+        out_metadata.update(json.loads(metadata))
+    path = f"{save_rawpath}{save_filename}.safetensors"
+    print(f"saving to path {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Room for two output tensor entries per key, plus the metadata
+    header_reserve = sum(2 * (len(k) + 200) for k in base_data.keys()) + len(json.dumps(out_metadata)) + HEADER_RESERVE_MARGIN
+    if rank_mode != "energy":
+        energy_target, min_rank = None, 1
+    resume_info = {"rank": rank, "solver": solver, "energy_target": energy_target, "min_rank": min_rank, "base": model_fingerprint(base_data), "other": model_fingerprint(other_data)}
+    writer = StreamingSafetensorsWriter(path, header_reserve, resume_info)
+    try:
+        do_lora_handle(base_data, other_data, rank, lambda: helper.callback(), solver, writer, energy_target, min_rank)
+        # Read back from the written tensors, so that keys done before a resume are included
+        ranks = {name[len("diffusion_model."):-len(".lora_down.weight")]: info["shape"][0] for name, info in writer.tensors.items() if name.endswith(".lora_down.weight")}
+        out_metadata["swarm.extract.rank_mode"] = rank_mode if energy_target is None else f"energy {energy_target} (rank {min_rank} to {rank})"
+        out_metadata["swarm.extract.ranks"] = json.dumps(ranks)
+        if ranks:
+            print(f"extracted {len(ranks)} layers with ranks from {min(ranks.values())} to {max(ranks.values())}, average {sum(ranks.values()) / len(ranks):.1f}")
+        writer.finish(out_metadata)
+    finally:
+        writer.close()
+
+def model_fingerprint(data, samples=4):
+    """Cheap identifier of a model's state dict (key count plus sums of a few tensors), to make sure a resumed extraction uses the same models."""
+    keys = sorted(data.keys())
+    sample_keys = keys[::max(1, len(keys) // samples)][:samples]
+    return [len(keys)] + [float(data[k].float().sum()) for k in sample_keys]
+
 class SwarmExtractLora:
     def __init__(self):
         self.loaded_lora = None
@@ -113,6 +397,12 @@ class SwarmExtractLora:
                 "save_rawpath": ("STRING", {"multiline": False}),
                 "save_filename": ("STRING", {"multiline": False}),
                 "metadata": ("STRING", {"multiline": True}),
+            },
+            "optional": {
+                "solver": (["exact", "randomized"], {"default": "exact", "tooltip": "'exact' runs a full SVD of every weight difference. 'randomized' only solves for the top components (with oversampling and power iterations), which is far faster for large layers at low ranks, at the cost of slightly higher reconstruction error. Per-key errors are logged to compare."}),
+                "rank_mode": (["fixed", "energy"], {"default": "fixed", "tooltip": "'fixed' uses 'rank' for every layer. 'energy' picks each layer's rank as the smallest that keeps 'energy_target' of its change (by singular values), between 'min_rank' and 'rank'. The chosen ranks are saved in the file metadata."}),
+                "energy_target": ("FLOAT", {"default": 0.9, "min": 0.01, "max": 1.0, "step": 0.01, "tooltip": "For 'energy' rank mode, the fraction of each layer's change to keep."}),
+                "min_rank": ("INT", {"default": 1, "min": 1, "max": 320, "tooltip": "For 'energy' rank mode, the lowest rank any layer may use."}),
             }
         }
 
@@ -122,40 +412,44 @@ class SwarmExtractLora:
     OUTPUT_NODE = True
     DESCRIPTION = "Internal node, do not use directly - extracts a LoRA from the difference between two models. This is used by SwarmUI Utilities tab."
 
-    def extract_lora(self, base_model, other_model, rank, save_rawpath, save_filename, metadata):
-        base_data = base_model.model_state_dict()
-        other_data = other_model.model_state_dict()
-        def clean_key(k):
-            if k.startswith("model."):
-                k = k[len("model."):]
-            if k.startswith("diffusion_model."):
-                k = k[len("diffusion_model."):]
-            return k
-        base_data = {clean_key(k): v for k, v in base_data.items()}
-        other_data = {clean_key(k): v for k, v in other_data.items()}
-        key_count = len(base_data.keys())
-        pbar = comfy.utils.ProgressBar(key_count)
-        class Helper:
-            steps = 0
-            def callback(self):
-                self.steps += 1
-                pbar.update_absolute(self.steps, key_count, None)
-        helper = Helper()
-        out_data = do_lora_handle(base_data, other_data, rank, lambda: helper.callback())
-
-        # Can't easily autodetect all the correct modelspec info, but at least supply some basics
-        out_metadata = {
-            "modelspec.title": f"(Extracted LoRA) {save_filename}",
-            "modelspec.description": f"LoRA extracted in SwarmUI"
+    def extract_lora(self, base_model, other_model, rank, save_rawpath, save_filename, metadata, solver="exact", rank_mode="fixed", energy_target=0.9, min_rank=1):
+        base_data = {clean_state_dict_key(k): v for k, v in base_model.model_state_dict().items()}
+        other_data = {clean_state_dict_key(k): v for k, v in other_model.model_state_dict().items()}
+        extract_and_save(base_data, other_data, rank, save_rawpath, save_filename, metadata, solver, rank_mode, energy_target, min_rank)
+        return ()
+
+class SwarmExtractLoraFromFiles:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "base_path": ("STRING", {"multiline": False, "tooltip": "Full path to the base model's safetensors file."}),
+                "other_path": ("STRING", {"multiline": False, "tooltip": "Full path to the other model's safetensors file."}),
+                "rank": ("INT", {"default": 16, "min": 1, "max": 320}),
+                "save_rawpath": ("STRING", {"multiline": False}),
+                "save_filename": ("STRING", {"multiline": False}),
+                "metadata": ("STRING", {"multiline": True}),
+            },
+            "optional": {
+                "solver": (["exact", "randomized"], {"default": "exact", "tooltip": "'exact' runs a full SVD of every weight difference. 'randomized' only solves for the top components (with oversampling and power iterations), which is far faster for large layers at low ranks, at the cost of slightly higher reconstruction error. Per-key errors are logged to compare."}),
+                "rank_mode": (["fixed", "energy"], {"default": "fixed", "tooltip": "'fixed' uses 'rank' for every layer. 'energy' picks each layer's rank as the smallest that keeps 'energy_target' of its change (by singular values), between 'min_rank' and 'rank'. The chosen ranks are saved in the file metadata."}),
+                "energy_target": ("FLOAT", {"default": 0.9, "min": 0.01, "max": 1.0, "step": 0.01, "tooltip": "For 'energy' rank mode, the fraction of each layer's change to keep."}),
+                "min_rank": ("INT", {"default": 1, "min": 1, "max": 320, "tooltip": "For 'energy' rank mode, the lowest rank any layer may use."}),
+            }
         }
-        if metadata:
-            out_metadata.update(json.loads(metadata))
-        path = f"{save_rawpath}{save_filename}.safetensors"
-        print(f"saving to path {path}")
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        safetensors.torch.save_file(out_data, path, metadata=out_metadata)
+
+    CATEGORY = "SwarmUI/models"
+    RETURN_TYPES = ()
+    FUNCTION = "extract_lora"
+    OUTPUT_NODE = True
+    DESCRIPTION = "Extracts a LoRA from the difference between two safetensors model files, without loading either model. Tensors are read from the memory-mapped files a few keys at a time, so this works even when the two models don't fit in memory together."
+
+    def extract_lora(self, base_path, other_path, rank, save_rawpath, save_filename, metadata, solver="exact", rank_mode="fixed", energy_target=0.9, min_rank=1):
+        with safe_open(base_path, framework="pt", device="cpu") as base_file, safe_open(other_path, framework="pt", device="cpu") as other_file:
+            extract_and_save(SafetensorsFileDict(base_file), SafetensorsFileDict(other_file), rank, save_rawpath, save_filename, metadata, solver, rank_mode, energy_target, min_rank)
         return ()
 
 NODE_CLASS_MAPPINGS = {
     "SwarmExtractLora": SwarmExtractLora,
+    "SwarmExtractLoraFromFiles": SwarmExtractLoraFromFiles,
 }
@@ -1,12 +1,11 @@
-from . import SwarmLoadImageB64
+from . import SwarmLoadImageB64, SwarmInputStore
 import folder_paths
 from nodes import CheckpointLoaderSimple, LoadImage
 from comfy_extras.nodes_video import LoadVideo
 from comfy_api.input_impl import VideoFromFile
-import os, base64, io
+import os, io
 try:
     from comfy_extras.nodes_audio import LoadAudio
-    from comfy_extras.nodes_audio import load as raw_audio_load
 except:
     print("Error: Nodes_Audio failed to import, Swarm will not be able to load audio files.")
 
@@ -232,7 +231,7 @@ class SwarmInputImage:
     CATEGORY = "SwarmUI/inputs"
     RETURN_TYPES = ("IMAGE","MASK",)
     FUNCTION = "do_input"
-    DESCRIPTION = "SwarmInput nodes let you define custom input controls in Swarm-Comfy Workflows. Image lets you input an image. Internally this node uses a Base64 string as input when value is set by SwarmUI server (Generate tab), otherwise use select Image (Comfy Workflow tab)."
+    DESCRIPTION = "SwarmInput nodes let you define custom input controls in Swarm-Comfy Workflows. Image lets you input an image. Internally this node uses a Base64 string or input store 'hash:' reference as input when value is set by SwarmUI server (Generate tab), otherwise use select Image (Comfy Workflow tab)."
 
     def do_input(self, value=None, image=None, **kwargs):
         if not value or value == "(Do Not Set Me)":
@@ -260,17 +259,13 @@ class SwarmInputAudio:
     CATEGORY = "SwarmUI/inputs"
     RETURN_TYPES = ("AUDIO",)
     FUNCTION = "do_input"
-    DESCRIPTION = "SwarmInput nodes let you define custom input controls in Swarm-Comfy Workflows. Audio lets you input an audio file. Internally this node uses a Base64 string as input when value is set by SwarmUI server (Generate tab), otherwise use select Audio (Comfy Workflow tab)."
+    DESCRIPTION = "SwarmInput nodes let you define custom input controls in Swarm-Comfy Workflows. Audio lets you input an audio file. Internally this node uses a Base64 string or input store 'hash:' reference as input when value is set by SwarmUI server (Generate tab), otherwise use select Audio (Comfy Workflow tab)."
 
     def do_input(self, value=None, audio=None, **kwargs):
         if not value or value == "(Do Not Set Me)":
             return LoadAudio().load_audio(audio)
         else:
-            audio_data = base64.b64decode(value)
-            audio_bytes = io.BytesIO(audio_data)
-            waveform, sample_rate = raw_audio_load(audio_bytes)
-            audio = {"waveform": waveform.unsqueeze(0), "sample_rate": sample_rate}
-            return (audio, )
+            return (SwarmLoadImageB64.b64_to_audio(value), )
 
 
 class SwarmInputVideo:
@@ -291,13 +286,13 @@ class SwarmInputVideo:
     CATEGORY = "SwarmUI/inputs"
     RETURN_TYPES = ("VIDEO",)
     FUNCTION = "do_input"
-    DESCRIPTION = "SwarmInput nodes let you define custom input controls in Swarm-Comfy Workflows. Video lets you input a video file. Internally this node uses a Base64 string as input when value is set by SwarmUI server (Generate tab), otherwise use select Video (Comfy Workflow tab)."
+    DESCRIPTION = "SwarmInput nodes let you define custom input controls in Swarm-Comfy Workflows. Video lets you input a video file. Internally this node uses a Base64 string or input store 'hash:' reference as input when value is set by SwarmUI server (Generate tab), otherwise use select Video (Comfy Workflow tab)."
 
     def do_input(self, value=None, video=None, **kwargs):
         if not value or value == "(Do Not Set Me)":
             return LoadVideo.execute(video)
         else:
-            video_data = base64.b64decode(value)
+            video_data = SwarmInputStore.input_bytes(value)
             video_bytes = io.BytesIO(video_data)
             return (VideoFromFile(video_bytes), )
 
@@ -0,0 +1,137 @@
+import folder_paths
+from server import PromptServer
+from aiohttp import web
+import base64, collections, hashlib, os, random, re, threading
+
+# Max total size of the input store on disk, least recently used inputs are removed past this
+INPUT_STORE_MAX_BYTES = 8 * 1024 * 1024 * 1024
+INPUT_REF_PREFIX = "hash:"
+HASH_PATTERN = re.compile("^[0-9a-f]{64}$")
+
+class InputStore:
+    """Content-addressed on-disk store of uploaded input files (images, audio, video), keyed by the sha256 of their bytes.
+    Least recently used files are removed once the store grows past its size cap."""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = None
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def folder(self) -> str:
+        return os.path.join(folder_paths.get_user_directory(), "swarm_input_store")
+
+    def path_for(self, hash: str) -> str:
+        return os.path.join(self.folder(), hash)
+
+    def load_index(self):
+        """Builds the in-memory LRU index from the store folder, oldest access first. Must hold the lock."""
+        if self.entries is not None:
+            return
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        folder = self.folder()
+        os.makedirs(folder, exist_ok=True)
+        files = []
+        for name in os.listdir(folder):
+            if HASH_PATTERN.match(name):
+                stat = os.stat(os.path.join(folder, name))
+                files.append((stat.st_mtime_ns, name, stat.st_size))
+            elif name.endswith(".tmp"):
+                os.remove(os.path.join(folder, name))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def has(self, hash: str) -> bool:
+        with self.lock:
+            self.load_index()
+            return hash in self.entries
+
+    def get_path(self, hash: str) -> str:
+        """Returns the file path of a stored input, marking it as recently used."""
+        if not HASH_PATTERN.match(hash):
+            raise ValueError(f"Invalid input hash '{hash}', must be a lowercase hex sha256")
+        with self.lock:
+            self.load_index()
+            if hash not in self.entries:
+                raise FileNotFoundError(f"Input '{hash}' is not in the input store, it may have been evicted and needs to be uploaded again")
+            self.entries.move_to_end(hash)
+            path = self.path_for(hash)
+            os.utime(path)
+            return path
+
+    def begin_upload(self) -> str:
+        with self.lock:
+            self.load_index()
+        return os.path.join(self.folder(), f"{'%016x' % random.getrandbits(64)}.tmp")
+
+    def finish_upload(self, temp_path: str, hash: str, size: int):
+        """Moves a fully written upload into place under its hash, then evicts old entries if the store is over its cap."""
+        with self.lock:
+            if hash in self.entries:
+                os.remove(temp_path)
+                self.entries.move_to_end(hash)
+                os.utime(self.path_for(hash))
+                return
+            os.replace(temp_path, self.path_for(hash))
+            self.entries[hash] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_hash, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                try:
+                    os.remove(self.path_for(old_hash))
+                except FileNotFoundError:
+                    pass
+
+INPUT_STORE = InputStore(INPUT_STORE_MAX_BYTES)
+
+def input_bytes(value: str) -> bytes:
+    """Returns the raw bytes for an input value, which is either a 'hash:' reference to the input store, or a base64 string."""
+    if value.startswith(INPUT_REF_PREFIX):
+        with open(INPUT_STORE.get_path(value[len(INPUT_REF_PREFIX):].strip()), "rb") as f:
+            return f.read()
+    return base64.b64decode(value)
+
+try:
+    routes = PromptServer.instance.routes
+
+    @routes.post("/swarm/input_store/upload")
+    async def upload_input(request):
+        """Stores the raw request body, returning its hash and the reference to use as a node input value."""
+        temp_path = INPUT_STORE.begin_upload()
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                async for chunk in request.content.iter_chunked(1024 * 1024):
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            hash = hasher.hexdigest()
+            expected = request.query.get("hash")
+            if expected is not None and expected != hash:
+                os.remove(temp_path)
+                return web.json_response({"error": f"Upload hash {hash} does not match expected hash {expected}"}, status=400)
+            INPUT_STORE.finish_upload(temp_path, hash, size)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return web.json_response({"hash": hash, "ref": f"{INPUT_REF_PREFIX}{hash}", "size": size})
+
+    @routes.post("/swarm/input_store/exists")
+    async def inputs_exist(request):
+        """Takes a JSON body of {"hashes": [...]} and returns which of those hashes are already in the store."""
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "Request body must be JSON"}, status=400)
+        hashes = body.get("hashes", []) if isinstance(body, dict) else None
+        if not isinstance(hashes, list) or not all(isinstance(h, str) for h in hashes):
+            return web.json_response({"error": "Request body must be {\"hashes\": [...]} with a list of hash strings"}, status=400)
+        present = [h for h in hashes if HASH_PATTERN.match(h) and INPUT_STORE.has(h)]
+        return web.json_response({"present": present, "missing": [h for h in hashes if h not in present]})
+except Exception as e:
+    import traceback
+    traceback.print_exc()
@@ -1,50 +1,263 @@
 from PIL import Image, ImageOps
 import numpy as np
-import torch, base64, io
-from comfy_api.input_impl import VideoFromFile
+import av, collections, hashlib, io, math, threading, torch
+from fractions import Fraction
+from . import SwarmInputStore
+from comfy_api.input_impl import VideoFromFile, VideoFromComponents
+from comfy_api.util import VideoComponents
 try:
     from comfy_extras.nodes_audio import load as raw_audio_load
 except:
     print("Error: Nodes_Audio failed to import, Swarm will not be able to load audio files.")
 
+# Input hashes are only cache keys, so a 128-bit non-cryptographic hash is plenty. xxhash is many times faster than sha256 or blake2b, but optional.
+try:
+    import xxhash
+    def hash_cache_key(data: bytes) -> bytes:
+        return xxhash.xxh3_128_digest(data)
+except ImportError:
+    def hash_cache_key(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+class DecodedMediaCache:
+    """Process-wide LRU cache of decoded input media tensors, keyed by a hash of the input value, and bounded by total tensor bytes.
+    Hits return copies, so that a node modifying its output in place can't corrupt the cached decode."""
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, kind: str, value: str) -> tuple:
+        # Input store references are already content hashes
+        if value.startswith(SwarmInputStore.INPUT_REF_PREFIX):
+            return (kind, value.strip())
+        return (kind, hash_cache_key(value.encode("utf-8")))
+
+    def get_or_decode(self, kind: str, value: str, decode):
+        """Returns a copy of the cached decode of the value, or decodes its bytes with the given function and caches the result."""
+        key = self.make_key(kind, value)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy_decoded(self.entries[key][0])
+            self.misses += 1
+        result = decode(SwarmInputStore.input_bytes(value))
+        tensors = result.values() if isinstance(result, dict) else result
+        size = sum(t.nbytes for t in tensors if isinstance(t, torch.Tensor))
+        with self.lock:
+            if size <= self.budget_bytes and key not in self.entries:
+                self.entries[key] = (result, size)
+                self.total_bytes += size
+                self.shrink()
+                result = copy_decoded(result)
+        print(f"[Swarm] Decoded {kind} input ({size / (1024 * 1024):.1f} MiB). Decoded media cache: {self.stats()}")
+        return result
+
+    def set_budget(self, budget_bytes: int):
+        with self.lock:
+            self.budget_bytes = budget_bytes
+            self.shrink()
+
+    def shrink(self):
+        while self.total_bytes > self.budget_bytes and self.entries:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.total_bytes -= old_size
+            self.evictions += 1
+
+    def stats(self) -> str:
+        return f"{len(self.entries)} entries, {self.total_bytes / (1024 * 1024):.1f} / {self.budget_bytes / (1024 * 1024):.0f} MiB, {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+DECODED_MEDIA_CACHE = DecodedMediaCache(2048 * 1024 * 1024)
+
+def copy_decoded(result):
+    """Copies a decoded (image, mask) tuple or audio dict, cloning its tensors."""
+    if isinstance(result, dict):
+        return {k: v.clone() if isinstance(v, torch.Tensor) else v for k, v in result.items()}
+    return tuple(t.clone() if isinstance(t, torch.Tensor) else t for t in result)
+
 def b64_to_img_and_mask(image_base64):
-    imageData = base64.b64decode(image_base64)
+    return DECODED_MEDIA_CACHE.get_or_decode("image", image_base64, bytes_to_img_and_mask)
+
+def b64_to_audio(audio_base64):
+    return DECODED_MEDIA_CACHE.get_or_decode("audio", audio_base64, bytes_to_audio)
+
+def bytes_to_audio(audio_data):
+    waveform, sample_rate = raw_audio_load(io.BytesIO(audio_data))
+    return {"waveform": waveform.unsqueeze(0), "sample_rate": sample_rate}
+
+def frame_has_alpha(frame):
+    return 'A' in frame.getbands() or 'transparency' in frame.info
+
+def fill_frame(frame, image, mask, index):
+    """Writes one PIL frame into preallocated float image and mask tensors at the given batch index, converting in place. Returns whether the frame had alpha."""
+    if frame_has_alpha(frame):
+        pixels = np.asarray(frame.convert("RGBA"))
+        frame_mask = mask[index].numpy()
+        np.copyto(frame_mask, pixels[..., 3])
+        np.divide(frame_mask, 255., out=frame_mask)
+        np.subtract(1., frame_mask, out=frame_mask)
+        pixels = pixels[..., :3]
+        has_alpha = True
+    else:
+        pixels = np.asarray(frame.convert("RGB"))
+        has_alpha = False
+    frame_image = image[index].numpy()
+    np.copyto(frame_image, pixels)
+    np.divide(frame_image, 255., out=frame_image)
+    return has_alpha
+
+def bytes_to_img_and_mask(imageData):
     i = Image.open(io.BytesIO(imageData))
     if hasattr(i, 'is_animated') and i.is_animated:
-        images = []
+        # Allocate the output once and fill it frame by frame, rather than stacking a list of frames and converting copies of the whole stack
+        width, height = i.size
+        image = torch.empty((i.n_frames, height, width, 3), dtype=torch.float32, device="cpu")
+        mask = torch.zeros((i.n_frames, height, width), dtype=torch.float32, device="cpu")
+        any_alpha = False
         for frame in range(i.n_frames):
             i.seek(frame)
-            images.append(i.convert("RGB"))
+            any_alpha = fill_frame(i, image, mask, frame) or any_alpha
         i.seek(0)
-        image = np.array(images).astype(np.float32) / 255.0
-        image = torch.from_numpy(image)
+        if any_alpha:
+            return (image, mask)
     else:
         i = ImageOps.exif_transpose(i)
-        image = i.convert("RGB")
-        image = np.array(image).astype(np.float32) / 255.0
-        image = torch.from_numpy(image)[None,]
-    if 'A' in i.getbands():
-        mask = np.array(i.getchannel('A')).astype(np.float32) / 255.0
-        mask = 1. - torch.from_numpy(mask)
-    else:
-        mask = torch.zeros((64,64), dtype=torch.float32, device="cpu")
-    return (image, mask.unsqueeze(0))
+        width, height = i.size
+        image = torch.empty((1, height, width, 3), dtype=torch.float32, device="cpu")
+        mask = torch.zeros((1, height, width), dtype=torch.float32, device="cpu")
+        if fill_frame(i, image, mask, 0):
+            return (image, mask)
+    return (image, torch.zeros((1, 64, 64), dtype=torch.float32, device="cpu"))
+
+def scaled_size(width, height, max_resolution):
+    """Returns the size to decode frames at so the longest side fits max_resolution (0 for no limit), keeping dimensions even."""
+    if max_resolution <= 0 or max(width, height) <= max_resolution:
+        return width, height
+    scale = max_resolution / max(width, height)
+    return max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+
+def decode_video_window(video_data, start_frame, frame_count, frame_stride, target_fps, max_resolution):
+    """Decodes only the frames a workflow needs from a video file, as (images, audio, frame_rate).
+    Output frame i is the source frame nearest to the time (start_frame + i * frame_stride) / fps, with fps being target_fps (or the source fps if 0), and exact ties going to the earlier frame.
+    The frame count is frame_count, or if 0 (or past the end) however many output frames fit in the rest of the video.
+    Decoding seeks to the nearest keyframe before the start, stops as soon as enough frames are found, and only converts (and downscales) the frames that are kept."""
+    with av.open(io.BytesIO(video_data)) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        source_fps = float(stream.average_rate or stream.guessed_rate or 24)
+        fps = target_fps if target_fps > 0 else source_fps
+        width, height = scaled_size(stream.codec_context.width, stream.codec_context.height, max_resolution)
+        stream_start = stream.start_time or 0
+        start_time = start_frame / fps
+        def frames_until(end_time):
+            # Rounded first so that float error in an exact multiple doesn't add a frame
+            available = max(0, math.ceil(round((end_time - start_time) * fps / frame_stride, 6)))
+            return available if frame_count <= 0 else min(frame_count, available)
+        if stream.duration:
+            expected_count = frames_until(float(stream.duration * stream.time_base))
+        elif container.duration:
+            expected_count = frames_until(container.duration / av.time_base)
+        else:
+            expected_count = None # Not known until the last frame is decoded
+        if start_time > 0.5 / source_fps:
+            container.seek(stream_start + int(start_time / stream.time_base), stream=stream, backward=True, any_frame=False)
+        frames = []
+        converted = (None, None)
+        def emit(frame):
+            nonlocal converted
+            if converted[0] is not frame:
+                converted = (frame, frame.to_ndarray(width=width, height=height, format="rgb24"))
+            frames.append(converted[1])
+        def target_time():
+            return start_time + len(frames) * frame_stride / fps
+        def done():
+            if expected_count is not None:
+                return len(frames) >= expected_count
+            return frame_count > 0 and len(frames) >= frame_count
+        # Tolerance for exact ties between two source frames, which float error would otherwise break either way
+        tie = 1e-6 / source_fps
+        previous, previous_time = None, None
+        for frame in container.decode(stream):
+            if frame.pts is None:
+                continue
+            frame_time = float((frame.pts - stream_start) * stream.time_base)
+            # Every target time up to this frame is nearest to either this frame or the one before it
+            while not done() and target_time() <= frame_time:
+                target = target_time()
+                emit(previous if previous is not None and target - previous_time <= frame_time - target + tie else frame)
+            if done():
+                break
+            previous, previous_time = frame, frame_time
+        if previous is not None:
+            if expected_count is None:
+                expected_count = frames_until(previous_time + 1 / source_fps)
+            # Target times past the last frame can only be nearest to it
+            while len(frames) < expected_count:
+                emit(previous)
+    if not frames:
+        raise ValueError(f"No video frames found in the requested window (start frame {start_frame} at {fps:g} fps)")
+    images = torch.empty((len(frames), height, width, 3), dtype=torch.float32, device="cpu")
+    for index, pixels in enumerate(frames):
+        frame_image = images[index].numpy()
+        np.copyto(frame_image, pixels)
+        np.divide(frame_image, 255., out=frame_image)
+    end_time = start_time + len(frames) * frame_stride / fps
+    return images, decode_audio_window(video_data, start_time, end_time), Fraction(fps / frame_stride).limit_denominator(1001)
+
+def decode_audio_window(video_data, start_time, end_time):
+    """Decodes the audio track of a video file between two times in seconds, or returns None if there is no audio."""
+    with av.open(io.BytesIO(video_data)) as container:
+        if len(container.streams.audio) == 0:
+            return None
+        stream = container.streams.audio[0]
+        stream_start = stream.start_time or 0
+        if start_time > 0:
+            container.seek(stream_start + int(start_time / stream.time_base), stream=stream, backward=True, any_frame=False)
+        chunks = []
+        sample_rate = stream.codec_context.sample_rate
+        # Convert whatever sample format the file uses to planar float
+        resampler = av.AudioResampler(format="fltp", layout=stream.codec_context.layout, rate=sample_rate)
+        first_time = None
+        for frame in container.decode(stream):
+            if frame.pts is None:
+                continue
+            frame_time = float((frame.pts - stream_start) * stream.time_base)
+            if frame_time >= end_time:
+                break
+            if first_time is None:
+                first_time = frame_time
+            chunks += [converted.to_ndarray() for converted in resampler.resample(frame)]
+    if not chunks:
+        return None
+    samples = np.concatenate(chunks, axis=1).astype(np.float32)
+    skip = max(0, round((start_time - first_time) * sample_rate))
+    samples = samples[:, skip:skip + round((end_time - start_time) * sample_rate)]
+    return {"waveform": torch.from_numpy(samples).unsqueeze(0), "sample_rate": sample_rate}
 
 class SwarmLoadImageB64:
     @classmethod
     def INPUT_TYPES(s):
         return {
             "required": {
-                "image_base64": ("STRING", {"multiline": True})
+                "image_base64": ("STRING", {"multiline": True, "tooltip": "The image file as a base64 string, or as a 'hash:' reference to a file uploaded to the Swarm input store."})
+            },
+            "optional": {
+                "cache_budget_mb": ("INT", {"default": 2048, "min": 0, "max": 1024 * 1024, "tooltip": "How many megabytes of decoded inputs to keep in RAM, so that the same input used again by later runs skips decoding. The cache is shared by all Swarm image and audio loading nodes, and the least recently used inputs are dropped first. 0 disables caching."}),
             }
         }
 
     CATEGORY = "SwarmUI/images"
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "load_image_b64"
-    DESCRIPTION = "Loads an image from a base64 string. Works like a regular LoadImage node, but with input format designed to be easier to use through automated calls, including SwarmUI with custom workflows."
+    DESCRIPTION = "Loads an image from a base64 string or input store reference. Works like a regular LoadImage node, but with input format designed to be easier to use through automated calls, including SwarmUI with custom workflows."
 
-    def load_image_b64(self, image_base64):
+    def load_image_b64(self, image_base64, cache_budget_mb=2048):
+        DECODED_MEDIA_CACHE.set_budget(cache_budget_mb * 1024 * 1024)
         return b64_to_img_and_mask(image_base64)
 
 class SwarmLoadVideoB64:
@@ -52,39 +265,48 @@ class SwarmLoadVideoB64:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "video_base64": ("STRING", {"multiline": True})
+                "video_base64": ("STRING", {"multiline": True, "tooltip": "The video file as a base64 string, or as a 'hash:' reference to a file uploaded to the Swarm input store."})
+            },
+            "optional": {
+                "start_frame": ("INT", {"default": 0, "min": 0, "max": 10000000, "tooltip": "The first frame to load, counted at the target FPS. Decoding seeks straight to it rather than decoding everything before it."}),
+                "frame_count": ("INT", {"default": 0, "min": 0, "max": 10000000, "tooltip": "How many frames to load, or 0 to load through the end of the video. Decoding stops once enough frames are loaded."}),
+                "frame_stride": ("INT", {"default": 1, "min": 1, "max": 10000, "tooltip": "Load only every Nth frame. The output frame rate is divided to match, so the clip keeps its duration."}),
+                "target_fps": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1000.0, "step": 0.01, "tooltip": "Resample to this frame rate by picking the nearest source frame for each output frame, or 0 to keep the source frame rate."}),
+                "max_resolution": ("INT", {"default": 0, "min": 0, "max": 16384, "tooltip": "Downscale frames during decode so the longest side is at most this many pixels, or 0 to keep the source resolution."}),
             }
         }
 
     CATEGORY = "SwarmUI/images"
     RETURN_TYPES = ("VIDEO",)
     FUNCTION = "load_video_b64"
-    DESCRIPTION = "Loads a video from a base64 string. Works like a regular LoadVideo node, but with input format designed to be easier to use through automated calls, including SwarmUI with custom workflows."
+    DESCRIPTION = "Loads a video from a base64 string or input store reference. Works like a regular LoadVideo node, but with input format designed to be easier to use through automated calls, including SwarmUI with custom workflows. Can optionally load only a window of the video, at a reduced frame rate or resolution, decoding only the frames needed."
 
-    def load_video_b64(self, video_base64):
-        video_data = base64.b64decode(video_base64)
-        video_bytes = io.BytesIO(video_data)
-        return (VideoFromFile(video_bytes), )
+    def load_video_b64(self, video_base64, start_frame=0, frame_count=0, frame_stride=1, target_fps=0.0, max_resolution=0):
+        video_data = SwarmInputStore.input_bytes(video_base64)
+        if start_frame == 0 and frame_count == 0 and frame_stride == 1 and target_fps == 0 and max_resolution == 0:
+            return (VideoFromFile(io.BytesIO(video_data)), )
+        images, audio, frame_rate = decode_video_window(video_data, start_frame, frame_count, frame_stride, target_fps, max_resolution)
+        return (VideoFromComponents(VideoComponents(images=images, audio=audio, frame_rate=frame_rate)), )
 
 class SwarmLoadAudioB64:
     @classmethod
     def INPUT_TYPES(s):
         return {
             "required": {
-                "audio_base64": ("STRING", {"multiline": True})
+                "audio_base64": ("STRING", {"multiline": True, "tooltip": "The audio file as a base64 string, or as a 'hash:' reference to a file uploaded to the Swarm input store."})
+            },
+            "optional": {
+                "cache_budget_mb": ("INT", {"default": 2048, "min": 0, "max": 1024 * 1024, "tooltip": "How many megabytes of decoded inputs to keep in RAM, so that the same input used again by later runs skips decoding. The cache is shared by all Swarm image and audio loading nodes, and the least recently used inputs are dropped first. 0 disables caching."}),
             }
         }
     CATEGORY = "SwarmUI/images"
     RETURN_TYPES = ("AUDIO",)
     FUNCTION = "load_audio_b64"
-    DESCRIPTION = "Loads an audio from a base64 string. Works like a regular LoadAudio node, but with input format designed to be easier to use through automated calls, including SwarmUI with custom workflows."
-
-    def load_audio_b64(self, audio_base64):
-        audio_data = base64.b64decode(audio_base64)
-        audio_bytes = io.BytesIO(audio_data)
-        waveform, sample_rate = raw_audio_load(audio_bytes)
-        audio = {"waveform": waveform.unsqueeze(0), "sample_rate": sample_rate}
-        return (audio, )
+    DESCRIPTION = "Loads an audio from a base64 string or input store reference. Works like a regular LoadAudio node, but with input format designed to be easier to use through automated calls, including SwarmUI with custom workflows."
+
+    def load_audio_b64(self, audio_base64, cache_budget_mb=2048):
+        DECODED_MEDIA_CACHE.set_budget(cache_budget_mb * 1024 * 1024)
+        return (b64_to_audio(audio_base64), )
 
 NODE_CLASS_MAPPINGS = {
     "SwarmLoadImageB64": SwarmLoadImageB64,
@@ -1,9 +1,232 @@
-import comfy
+import comfy, comfy.lora, comfy.model_management, comfy.sd, comfy.utils
 import folder_paths
+import collections, concurrent.futures, functools, hashlib, json, os, threading, torch, weakref
+
+# Max number of LoRA files read from disk at once
+LORA_PREFETCH_WORKERS = 4
+
+class LoraCache:
+    """Process-wide LRU cache of loaded LoRA state dicts, keyed by file path, modification time and size, and bounded by total tensor bytes."""
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def load(self, path: str) -> dict:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+        lora = comfy.utils.load_torch_file(path, safe_load=True)
+        size = sum(v.nbytes for v in lora.values() if isinstance(v, torch.Tensor))
+        with self.lock:
+            # Drop any older version of the same file
+            for old_key in [k for k in self.entries if k[0] == path]:
+                self.remove(old_key)
+            if size <= self.budget_bytes:
+                self.entries[key] = (lora, size)
+                self.total_bytes += size
+                self.shrink()
+        print(f"[Swarm] Loaded LoRA {path} from disk ({size / (1024 * 1024):.1f} MiB). LoRA cache: {self.stats()}")
+        return lora
+
+    def set_budget(self, budget_bytes: int):
+        with self.lock:
+            self.budget_bytes = budget_bytes
+            self.shrink()
+
+    def shrink(self):
+        while self.total_bytes > self.budget_bytes and self.entries:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self) -> str:
+        return f"{len(self.entries)} entries, {self.total_bytes / (1024 * 1024):.1f} / {self.budget_bytes / (1024 * 1024):.0f} MiB, {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+LORA_CACHE = LoraCache(4096 * 1024 * 1024)
+
+class PatchedModelCache:
+    """Process-wide LRU cache of the final patched (model, clip) pair for a LoRA stack on a given base model and clip.
+    Each entry counts the bytes of the LoRA tensors its patches hold on to, and entries are dropped past the byte budget (a budget of 0 disables the cache).
+    Entries are also dropped when their base model or clip object is garbage collected, when any of the LoRA files change, and when Comfy unloads all models."""
+    def __init__(self, max_entries: int, budget_bytes: int):
+        self.max_entries = max_entries
+        self.budget_bytes = budget_bytes
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.watched = set()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, model, clip, stack: list) -> tuple:
+        files = []
+        for path, weight in stack:
+            stat = os.stat(path)
+            files.append((path, stat.st_mtime_ns, stat.st_size, weight))
+        return (id(model), id(clip), tuple(files))
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, model, clip, result: tuple, size: int):
+        with self.lock:
+            if self.budget_bytes <= 0 or size > self.budget_bytes:
+                return
+            for base in (model, clip):
+                if base is not None and id(base) not in self.watched:
+                    self.watched.add(id(base))
+                    weakref.finalize(base, self.drop_base, id(base))
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (result, size)
+            self.total_bytes += size
+            self.shrink()
+
+    def set_budget(self, budget_bytes: int):
+        with self.lock:
+            self.budget_bytes = budget_bytes
+            self.shrink()
+
+    def shrink(self):
+        while self.entries and (self.total_bytes > self.budget_bytes or len(self.entries) > self.max_entries):
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def drop_base(self, base_id: int):
+        with self.lock:
+            self.watched.discard(base_id)
+            for key in [k for k in self.entries if base_id in (k[0], k[1])]:
+                self.remove(key)
+
+PATCHED_MODEL_CACHE = PatchedModelCache(8, 4096 * 1024 * 1024)
+
+def install_unload_hook():
+    """Clears PATCHED_MODEL_CACHE whenever Comfy unloads all models (eg a 'free memory' request), as cached entries would otherwise keep the patched models and their LoRA weights alive."""
+    upstream = comfy.model_management.unload_all_models
+    if getattr(upstream, "swarm_hooked", False):
+        return
+    def unload_all_models(*args, **kwargs):
+        PATCHED_MODEL_CACHE.clear()
+        return upstream(*args, **kwargs)
+    functools.update_wrapper(unload_all_models, upstream)
+    unload_all_models.swarm_hooked = True
+    comfy.model_management.unload_all_models = unload_all_models
+
+install_unload_hook()
+
+KEY_MAP_CACHE = weakref.WeakKeyDictionary()
+KEY_MAP_BY_SIGNATURE = {}
+KEY_MAP_LOCK = threading.Lock()
+
+def key_map_to_json(value):
+    if isinstance(value, tuple):
+        return {"t": [key_map_to_json(v) for v in value]}
+    return value
+
+def key_map_from_json(value):
+    if isinstance(value, dict):
+        return tuple(key_map_from_json(v) for v in value["t"])
+    return value
+
+@functools.cache
+def key_map_code_version() -> str:
+    """Identifies the ComfyUI version and the code that builds LoRA key maps, so that saved maps are rebuilt after an update changes how keys are mapped."""
+    hasher = hashlib.sha256()
+    try:
+        import comfyui_version
+        hasher.update(comfyui_version.__version__.encode("utf-8"))
+    except ImportError:
+        pass
+    # comfy.utils holds the diffusers key conversion tables that the comfy.lora key map functions use
+    for module in (comfy.lora, comfy.utils):
+        with open(module.__file__, "rb") as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+def module_structure(module) -> str:
+    """Describes what determines a module's state dict key names: its class, plus its architecture config for diffusion models (which can be large, so their state dicts aren't walked).
+    Modules without a known config (text encoders, which are comparatively small) fall back to their key names."""
+    name = f"{type(module).__module__}.{type(module).__qualname__}"
+    config = getattr(getattr(module, "model_config", None), "unet_config", None)
+    if isinstance(config, dict):
+        return f"{name}\n{json.dumps(config, sort_keys=True, default=str)}"
+    return f"{name}\n" + "\n".join(module.state_dict(keep_vars=True).keys())
+
+def cached_key_map(module, kind: str, builder: callable) -> dict:
+    """Returns the LoRA key map for a diffusion model or text encoder module, as built by the given comfy.lora function. The returned dict is shared and must not be modified.
+    Maps are kept in memory per module object and per module structure, and saved to disk keyed by the module structure and the key mapping code version, so that the same architecture is only mapped once."""
+    with KEY_MAP_LOCK:
+        if module in KEY_MAP_CACHE:
+            return KEY_MAP_CACHE[module]
+    signature = hashlib.sha256(f"{kind}\n{key_map_code_version()}\n{module_structure(module)}".encode("utf-8")).hexdigest()
+    with KEY_MAP_LOCK:
+        key_map = KEY_MAP_BY_SIGNATURE.get(signature)
+    path = os.path.join(folder_paths.get_user_directory(), "swarm_lora_keymaps", f"{kind}_{signature}.json")
+    if key_map is None and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                key_map = {k: key_map_from_json(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[Swarm] Ignoring unreadable LoRA key map {path}: {e}")
+    if key_map is None:
+        key_map = builder(module, {})
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({k: key_map_to_json(v) for k, v in key_map.items()}, f)
+            os.replace(f"{path}.tmp", path)
+        except (OSError, TypeError) as e:
+            print(f"[Swarm] Could not save LoRA key map {path}: {e}")
+    with KEY_MAP_LOCK:
+        KEY_MAP_CACHE[module] = key_map
+        KEY_MAP_BY_SIGNATURE[signature] = key_map
+    return key_map
+
+def install_cached_key_maps():
+    """Wraps comfy.lora's key map functions with cached_key_map, so that comfy.sd.load_lora_for_models (and any other LoRA loading) reuses key maps instead of rebuilding them for every LoRA."""
+    for kind, name in (("unet", "model_lora_keys_unet"), ("clip", "model_lora_keys_clip")):
+        upstream = getattr(comfy.lora, name)
+        if getattr(upstream, "swarm_cached", False):
+            continue
+        def cached(module, key_map=None, kind=kind, upstream=upstream):
+            key_map = {} if key_map is None else key_map
+            key_map.update(cached_key_map(module, kind, upstream))
+            return key_map
+        functools.update_wrapper(cached, upstream)
+        cached.swarm_cached = True
+        setattr(comfy.lora, name, cached)
+
+install_cached_key_maps()
 
 class SwarmLoraLoader:
-    def __init__(self):
-        self.loaded_lora = None
 
     @classmethod
     def INPUT_TYPES(s):
@@ -13,6 +236,9 @@ class SwarmLoraLoader:
                 "clip": ("CLIP", ),
                 "lora_names": ("STRING", {"multiline": True, "tooltip": "Comma separated list of lora names to load."}),
                 "lora_weights": ("STRING", {"multiline": True, "tooltip": "Comma separated list of lora weights to apply to each lora. Must match the number of loras."}),
+            },
+            "optional": {
+                "cache_budget_mb": ("INT", {"default": 4096, "min": 0, "max": 1024 * 1024, "tooltip": "How many megabytes of loaded LoRAs to keep in RAM for reuse by later runs. The same budget separately bounds the LoRA weights held by cached LoRA-patched models. The caches are shared by all SwarmLoraLoader nodes, and the least recently used entries are dropped first. 0 disables caching."}),
             }
         }
 
@@ -21,34 +247,35 @@ class SwarmLoraLoader:
     FUNCTION = "load_loras"
     DESCRIPTION = "Like a regular LoRA Loader, but designed to take a dynamic list of loras and weights, to allow easier integration with SwarmUI custom workflows."
 
-    def load_loras(self, model, clip, lora_names, lora_weights):
+    def load_loras(self, model, clip, lora_names, lora_weights, cache_budget_mb=4096):
+        LORA_CACHE.set_budget(cache_budget_mb * 1024 * 1024)
+        PATCHED_MODEL_CACHE.set_budget(cache_budget_mb * 1024 * 1024)
         if lora_names.strip() == "":
             return (model, clip)
 
         lora_names = lora_names.split(",")
         lora_weights = lora_weights.split(",")
         lora_weights = [float(x.strip()) for x in lora_weights]
+        needed = [(folder_paths.get_full_path("loras", lora_names[i].strip()), lora_weights[i]) for i in range(len(lora_names)) if lora_weights[i] != 0]
+        if not needed:
+            return (model, clip)
+
+        cache_key = PATCHED_MODEL_CACHE.make_key(model, clip, needed)
+        cached = PATCHED_MODEL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        base_model, base_clip = model, clip
 
-        for i in range(len(lora_names)):
-            lora_name = lora_names[i].strip()
-            weight = lora_weights[i]
-            if weight == 0:
-                continue
-            # This section copied directly from default comfy LoraLoader
-            lora_path = folder_paths.get_full_path("loras", lora_name)
-            lora = None
-            if self.loaded_lora is not None:
-                if self.loaded_lora[0] == lora_path:
-                    lora = self.loaded_lora[1]
-                else:
-                    temp = self.loaded_lora
-                    self.loaded_lora = None
-                    del temp
-            if lora is None:
-                lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-                self.loaded_lora = (lora_path, lora)
-            model, clip = comfy.sd.load_lora_for_models(model, clip, lora, weight, weight)
+        # Start reading every file at once, then patch in order as each one becomes available
+        paths = list(dict.fromkeys(path for path, _ in needed))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(paths), LORA_PREFETCH_WORKERS)) as pool:
+            loads = {path: pool.submit(LORA_CACHE.load, path) for path in paths}
+            for lora_path, weight in needed:
+                lora = loads[lora_path].result()
+                model, clip = comfy.sd.load_lora_for_models(model, clip, lora, weight, weight)
+            size = sum(v.nbytes for path in paths for v in loads[path].result().values() if isinstance(v, torch.Tensor))
 
+        PATCHED_MODEL_CACHE.put(cache_key, base_model, base_clip, (model, clip), size)
         return (model, clip)
 
 NODE_CLASS_MAPPINGS = {
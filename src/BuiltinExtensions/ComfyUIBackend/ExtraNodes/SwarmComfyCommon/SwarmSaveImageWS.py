@@ -1,11 +1,50 @@
 from PIL import Image
+from PIL.PngImagePlugin import PngInfo
 import numpy as np
 from server import PromptServer, BinaryEventTypes
-import time, io, struct
+from comfy_execution.utils import get_executing_context
+import torch, time, io, struct, json, threading, queue, traceback
 
 SPECIAL_ID = 12345 # Tells swarm that the node is going to output final images
 VIDEO_ID = 12346
 TEXT_ID = 12347
+EXIF_IFD = 0x8769
+EXIF_USER_COMMENT = 0x9286
+QUANTIZE_CHUNK_PIXELS = 64 * 1024 * 1024 # Max number of float values to hold on-device at once while quantizing
+PREVIEW_SIZE = 256 # Shortest side of preview thumbnails, matches SwarmUI's own image-history previews
+ASYNC_ENCODE_MEMORY_BUDGET = 2 * 1024 * 1024 * 1024 # Max bytes of quantized image and animation data waiting in the async encoder before save nodes block
+TYPE_MIME_TYPES = {1: "image/jpeg", 2: "image/png", 3: "image/webp", 4: "image/gif", 5: "video/mp4", 6: "video/webm", 7: "video/quicktime"}
+
+def images_to_numpy(images: torch.Tensor, bit_depth: int = 8, out: np.ndarray = None) -> np.ndarray:
+    """Quantizes a float [0,1] image batch to uint8 (or uint16 if bit_depth is 16) on the tensor's own device, and then transfers it to the CPU in one copy.
+    If `out` is given (a native byte order array of the right shape and dtype), the result is written into it rather than into a new array."""
+    max_val = 255.0 if bit_depth == 8 else 65535.0
+    # torch uint16 has very limited device support, so 16-bit data is shifted into int16 for the transfer and shifted back after
+    dtype = torch.uint8 if bit_depth == 8 else torch.int16
+    offset = 0 if bit_depth == 8 else 32768
+    out_tensor = None if out is None else torch.from_numpy(out if bit_depth == 8 else out.view(np.int16))
+    # On the CPU, quantize straight into the output
+    quantized = out_tensor if out_tensor is not None and images.device.type == "cpu" else torch.empty(images.shape, dtype=dtype, device=images.device)
+    chunk = max(1, QUANTIZE_CHUNK_PIXELS // max(1, images[0].numel()))
+    for start in range(0, images.shape[0], chunk):
+        part = images[start:start + chunk].to(dtype=torch.float32) * max_val
+        quantized[start:start + chunk] = part.clamp_(0, max_val).round_().sub_(offset).to(dtype)
+        del part
+    if out_tensor is not None:
+        if quantized is not out_tensor:
+            out_tensor.copy_(quantized)
+        host = out_tensor
+    elif quantized.device.type == "cuda":
+        host = torch.empty(quantized.shape, dtype=dtype, pin_memory=True)
+        host.copy_(quantized, non_blocking=True)
+        torch.cuda.current_stream(quantized.device).synchronize()
+    else:
+        host = quantized.cpu()
+    result = host.numpy()
+    if bit_depth == 16:
+        result = result.view(np.uint16)
+        result ^= 0x8000
+    return result
 
 def send_image_to_server_raw(type_num: int, save_me: callable, id: int, event_type: int = BinaryEventTypes.PREVIEW_IMAGE):
     out = io.BytesIO()
@@ -18,6 +57,107 @@ def send_image_to_server_raw(type_num: int, save_me: callable, id: int, event_ty
     server.send_sync("progress", {"value": id, "max": id}, sid=server.client_id)
     server.send_sync(event_type, preview_bytes, sid=server.client_id)
 
+def resize_for_preview(images: torch.Tensor, size: int) -> torch.Tensor:
+    """Downscales an image batch on its own device so that its shortest side is at most `size`."""
+    height, width = images.shape[1:3]
+    factor = size / min(width, height)
+    if factor >= 1:
+        return images
+    target = (max(1, int(height * factor)), max(1, int(width * factor)))
+    return torch.nn.functional.interpolate(images.movedim(-1, 1).to(dtype=torch.float32), size=target, mode="area").movedim(1, -1)
+
+def send_output_with_metadata_to_server(type_num: int, save_me: callable, id: int, previews: dict = None, async_target: dict = None, stream: dict = None):
+    """Sends a final output file with a metadata header, optionally together with pre-made preview files (dict of 'jpg'/'webp' to bytes) appended after the main file.
+    If async_target is given (from AsyncOutputEncoder), the output is tagged with its prompt and node and sent to the client that queued it.
+    If stream is given (from SwarmSaveAnimationWS's OutputStream), this is one piece of a streamed output, and the dict's keys are added to the metadata."""
+    server = PromptServer.instance
+    metadata = {"mime_type": TYPE_MIME_TYPES[type_num], "id": 0}
+    metadata.update(stream or {})
+    previews = previews or {}
+    for key, data in previews.items():
+        metadata[f"preview_{key}_length"] = len(data)
+    if async_target is not None:
+        metadata.update({"async_output": True, "prompt_id": async_target["prompt_id"], "node_id": async_target["node_id"]})
+    metadata_json = json.dumps(metadata).encode('utf-8')
+    out = io.BytesIO()
+    out.write(struct.pack(">I", len(metadata_json)))
+    out.write(metadata_json)
+    save_me(out)
+    for data in previews.values():
+        out.write(data)
+    # 9999123 is sent as event 4 (preview-with-metadata), see SwarmInternalUtil
+    if async_target is not None:
+        # No progress message here, as other nodes may be running by now and it would mislabel their previews
+        server.send_sync(9999123, out.getvalue(), sid=async_target["sid"])
+    elif stream is not None:
+        # Stream pieces are recognized by their stream ID, and may be sent from a pipe reader thread
+        server.send_sync(9999123, out.getvalue(), sid=server.client_id)
+    else:
+        server.send_sync("progress", {"value": id, "max": id}, sid=server.client_id)
+        server.send_sync(9999123, out.getvalue(), sid=server.client_id)
+
+def send_raw_pixels_to_server(image: torch.Tensor, bit_depth: int, id: int):
+    """Sends one HxWxC float image as uint8 or uint16 pixels without any encoding, as a compact header (width, height, channels, bytes per channel, row stride) followed by the pixel rows.
+    The pixels are quantized straight into the message buffer, so the pixel data is not copied again to build the message."""
+    height, width, channels = image.shape
+    itemsize = 1 if bit_depth == 8 else 2
+    # Format id 0 on the raw event marks a raw pixel buffer (as opposed to 1 for BMP)
+    header = struct.pack(">IIIIII", 0, width, height, channels, itemsize, width * channels * itemsize)
+    message = bytearray(len(header) + height * width * channels * itemsize)
+    message[:len(header)] = header
+    pixels = np.frombuffer(message, dtype=np.uint8 if bit_depth == 8 else np.dtype('<u2'), offset=len(header)).reshape(1, height, width, channels)
+    images_to_numpy(image[None], bit_depth, out=pixels)
+    del pixels
+    server = PromptServer.instance
+    server.send_sync("progress", {"value": id, "max": id}, sid=server.client_id)
+    server.send_sync(10, message, sid=server.client_id)
+
+class AsyncOutputEncoder:
+    """Runs output encode-and-send jobs on a background thread, in submission order, so the next prompt can start while outputs are still being encoded.
+    One shared instance (ASYNC_ENCODER) serves both image and animation save nodes, so all of a prompt's outputs share one budget and keep their order.
+    Jobs hold already-quantized CPU data, and submitting blocks while the queued data exceeds the memory budget."""
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self.queued_bytes = 0
+        self.condition = threading.Condition()
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def submit(self, job: callable, size: int, count: int):
+        """Queues job(async_target) to run in the background, where `size` is the bytes of data it holds and `count` the number of outputs it will send."""
+        server = PromptServer.instance
+        context = get_executing_context()
+        target = {
+            "sid": server.client_id,
+            "prompt_id": context.prompt_id if context is not None else server.last_prompt_id,
+            "node_id": context.node_id if context is not None else server.last_node_id
+        }
+        with self.condition:
+            while self.queued_bytes > 0 and self.queued_bytes + size > self.memory_budget:
+                self.condition.wait()
+            self.queued_bytes += size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="SwarmAsyncOutputEncoder", daemon=True)
+                self.thread.start()
+        # Tells Swarm to keep listening for these outputs after the prompt itself completes
+        server.send_sync("swarm_async_output", {"prompt_id": target["prompt_id"], "count": count}, sid=target["sid"])
+        self.jobs.put((job, size, target))
+
+    def run(self):
+        while True:
+            job, size, target = self.jobs.get()
+            try:
+                job(target)
+            except Exception as e:
+                traceback.print_exc()
+                PromptServer.instance.send_sync("swarm_async_output_failed", {"prompt_id": target["prompt_id"], "error": str(e)}, sid=target["sid"])
+            finally:
+                with self.condition:
+                    self.queued_bytes -= size
+                    self.condition.notify_all()
+
+ASYNC_ENCODER = AsyncOutputEncoder(ASYNC_ENCODE_MEMORY_BUDGET)
+
 class SwarmSaveImageWS:
     @classmethod
     def INPUT_TYPES(s):
@@ -26,7 +166,12 @@ class SwarmSaveImageWS:
                 "images": ("IMAGE", ),
             },
             "optional": {
-                "bit_depth": (["8bit", "16bit", "raw"], {"default": "8bit"})
+                "bit_depth": (["8bit", "16bit", "raw", "raw_uint8", "raw_uint16"], {"default": "8bit", "tooltip": "'raw' sends an uncompressed BMP. 'raw_uint8' and 'raw_uint16' send the pixel buffer directly with no encoding at all, leaving SwarmUI to encode to the final format."}),
+                "format": (["png", "jpg", "webp", "webp_lossless"], {"default": "png", "tooltip": "The final file format to encode as. Only used for 8bit output, other bit depths always send PNG or raw data."}),
+                "quality": ("INT", {"default": 95, "min": 1, "max": 100, "tooltip": "Quality for lossy formats (jpg, webp)."}),
+                "metadata": ("STRING", {"default": "", "multiline": True, "tooltip": "Optional metadata text to embed in the file, as PNG 'parameters' text or EXIF UserComment for other formats."}),
+                "preview": ("BOOLEAN", {"default": False, "tooltip": "If true, a small JPEG preview thumbnail is generated from the in-memory image and sent along with it, so that SwarmUI does not need to decode the full image again to build its history thumbnail. Not used for raw output modes."}),
+                "async_encode": ("BOOLEAN", {"default": False, "tooltip": "If true, the image is encoded and sent on a background thread so the next prompt can start without waiting. Outputs are tagged with their prompt ID and delivered in order. Not used for raw output modes."}),
             }
         }
 
@@ -36,26 +181,65 @@ class SwarmSaveImageWS:
     OUTPUT_NODE = True
     DESCRIPTION = "Acts like a special version of 'SaveImage' that doesn't actual save to disk, instead it sends directly over websocket. This is intended so that SwarmUI can save the image itself rather than having Comfy's Core save it."
 
-    def save_images(self, images, bit_depth = "8bit"):
-        for image in images:
+    def save_images(self, images, bit_depth = "8bit", format = "png", quality = 95, metadata = "", preview = False, async_encode = False):
+        if bit_depth in ["raw_uint8", "raw_uint16"]:
+            for image in images:
+                send_raw_pixels_to_server(image, 16 if bit_depth == "raw_uint16" else 8, SPECIAL_ID)
+            return {}
+        raw_images = images_to_numpy(images, 16 if bit_depth == "16bit" else 8)
+        preview_images = None
+        if preview and bit_depth in ["8bit", "16bit"]:
+            preview_images = images_to_numpy(resize_for_preview(images, PREVIEW_SIZE))
+        if async_encode and bit_depth in ["8bit", "16bit"]:
+            size = raw_images.nbytes + (0 if preview_images is None else preview_images.nbytes)
+            ASYNC_ENCODER.submit(lambda target: self.encode_and_send(raw_images, preview_images, bit_depth, format, quality, metadata, target), size, len(raw_images))
+        else:
+            self.encode_and_send(raw_images, preview_images, bit_depth, format, quality, metadata)
+        return {}
+
+    def encode_and_send(self, raw_images, preview_images, bit_depth, format, quality, metadata, async_target = None):
+        def send(type_num, do_save, index):
+            if preview_images is None and async_target is None:
+                send_image_to_server_raw(type_num, do_save, SPECIAL_ID)
+                return
+            previews = None
+            if preview_images is not None:
+                jpg = io.BytesIO()
+                Image.fromarray(preview_images[index]).save(jpg, format='JPEG', quality=90)
+                previews = {"jpg": jpg.getvalue()}
+            send_output_with_metadata_to_server(type_num, do_save, SPECIAL_ID, previews, async_target)
+        for index, raw_image in enumerate(raw_images):
             if bit_depth == "raw":
-                i = 255.0 * image.cpu().numpy()
-                img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+                img = Image.fromarray(raw_image)
                 def do_save(out):
                     img.save(out, format='BMP')
                 send_image_to_server_raw(1, do_save, SPECIAL_ID, event_type=10)
             elif bit_depth == "16bit":
-                i = 65535.0 * image.cpu().numpy()
-                img = self.convert_img_16bit(np.clip(i, 0, 65535).astype(np.uint16))
-                send_image_to_server_raw(2, lambda out: out.write(img), SPECIAL_ID)
+                img = self.convert_img_16bit(raw_image)
+                send(2, lambda out: out.write(img), index)
             else:
-                i = 255.0 * image.cpu().numpy()
-                img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-                def do_save(out):
-                    img.save(out, format='PNG')
-                send_image_to_server_raw(2, do_save, SPECIAL_ID)
+                img = Image.fromarray(raw_image)
+                type_num, do_save = self.encode_image(img, format, quality, metadata)
+                send(type_num, do_save, index)
 
-        return {}
+    def encode_image(self, img, format, quality, metadata):
+        """Returns (type_num, do_save) to encode the image once, directly into its final file format with metadata attached."""
+        if format == "png":
+            pnginfo = None
+            if metadata:
+                pnginfo = PngInfo()
+                pnginfo.add_text("parameters", metadata)
+            return 2, lambda out: img.save(out, format='PNG', pnginfo=pnginfo)
+        exif = Image.Exif()
+        if metadata:
+            # Matches how SwarmUI itself writes UserComment (UTF-16 with a charset prefix, in the little-endian byte order PIL writes EXIF with)
+            # UserComment belongs in the Exif sub-IFD, not IFD0, or many readers won't find it
+            exif.get_ifd(EXIF_IFD)[EXIF_USER_COMMENT] = b"UNICODE\0" + metadata.encode("utf-16-le")
+        if format == "jpg":
+            return 1, lambda out: img.save(out, format='JPEG', quality=quality, exif=exif)
+        if format == "webp_lossless":
+            return 3, lambda out: img.save(out, format='WEBP', lossless=True, quality=100, exif=exif)
+        return 3, lambda out: img.save(out, format='WEBP', quality=quality, exif=exif)
 
     def convert_img_16bit(self, img_np):
         try:
@@ -72,7 +256,7 @@ class SwarmSaveImageWS:
             raise
 
     @classmethod
-    def IS_CHANGED(s, images, bit_depth = "8bit"):
+    def IS_CHANGED(s, images, bit_depth = "8bit", format = "png", quality = 95, metadata = "", preview = False, async_encode = False):
         return time.time()
 
 
@@ -99,11 +283,7 @@ class SwarmSaveAnimatedWebpWS:
 
     def save_images(self, images, fps, lossless, quality, method):
         method = self.methods.get(method)
-        pil_images = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
+        pil_images = [Image.fromarray(raw_image) for raw_image in images_to_numpy(images)]
 
         def do_save(out):
             pil_images[0].save(out, save_all=True, duration=int(1000.0/fps), append_images=pil_images[1 : len(pil_images)], lossless=lossless, quality=quality, method=method, format='WEBP')
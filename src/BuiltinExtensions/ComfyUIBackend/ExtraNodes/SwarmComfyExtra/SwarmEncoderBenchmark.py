@@ -0,0 +1,138 @@
+import json, math, os, random, subprocess, time
+import numpy as np
+from PIL import Image
+import folder_paths
+from .SwarmSaveAnimationWS import FFMPEG_PATH, DEFAULT_VIDEO_ARGS, run_ffmpeg, encoder_profile_path, load_encoder_profile
+
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]
+FORMAT_EXTENSIONS = {"h264-mp4": "mp4", "h265-mp4": "mp4", "webm": "webm", "prores": "mov"}
+# Candidate ffmpeg video args per format, each a full replacement for the format's DEFAULT_VIDEO_ARGS
+ENCODER_CANDIDATES = {
+    "h264-mp4": [["-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", preset, "-crf", crf] for preset in X264_PRESETS for crf in ["19", "23"]],
+    "h265-mp4": [["-c:v", "libx265", "-pix_fmt", "yuv420p", "-preset", preset, "-crf", crf] for preset in X264_PRESETS for crf in ["23", "28"]],
+    "webm": [["-c:v", "libvpx-vp9", "-pix_fmt", "yuv420p", "-crf", crf, "-b:v", "0", "-deadline", deadline, "-cpu-used", cpu_used, "-row-mt", "1"] for deadline, cpu_used in [("realtime", "8"), ("good", "5"), ("good", "3")] for crf in ["23", "31"]],
+    "prores": [["-c:v", "prores_ks", "-profile:v", profile, "-pix_fmt", "yuv422p10le"] for profile in ["0", "1", "2", "3"]],
+}
+
+def make_synthetic_clip(width: int, height: int, frames: int) -> np.ndarray:
+    """Builds a deterministic uint8 test clip of smooth color fields, fine grain and panning motion, as a rough stand-in for generated video."""
+    rng = np.random.default_rng(1234)
+    field = Image.fromarray(rng.integers(0, 256, (height // 32 + 2, width // 16 + 2, 3), dtype=np.uint8)).resize((width * 2, height), Image.Resampling.BICUBIC)
+    field = np.asarray(field, dtype=np.float32)
+    grain = rng.normal(0, 2, (height, width, 3)).astype(np.float32)
+    clip = np.empty((frames, height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        offset = int(i * width / max(1, frames))
+        shift = 16 * math.sin(i / 8)
+        clip[i] = np.clip(field[:, offset:offset + width] + grain + shift, 0, 255)
+    return clip
+
+def psnr(reference: np.ndarray, decoded: np.ndarray) -> float:
+    mse = np.mean((reference.astype(np.float32) - decoded.astype(np.float32)) ** 2)
+    return 100.0 if mse == 0 else float(10 * math.log10(255 * 255 / mse))
+
+def benchmark_candidate(format: str, video_args: list, threads: int, clip: np.ndarray, fps: float) -> dict:
+    """Encodes the clip with one candidate, then decodes it back, returning timing, size and quality figures, or an 'error' entry."""
+    frames, height, width = clip.shape[:3]
+    path = folder_paths.get_save_image_path("swarm_tmp_", folder_paths.get_temp_directory())[0]
+    file = os.path.join(path, f"swarm_tmp_bench_{'%016x' % random.getrandbits(64)}.{FORMAT_EXTENSIONS[format]}")
+    args = [FFMPEG_PATH, "-v", "error"] + (["-filter_threads", str(threads)] if threads > 0 else []) + ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-", "-y"]
+    output_args = video_args + (["-threads", str(threads)] if threads > 0 else []) + [file]
+    try:
+        start = time.perf_counter()
+        result = run_ffmpeg(args, output_args, clip)
+        seconds = time.perf_counter() - start
+        if result.returncode != 0:
+            return {"error": result.stderr.decode("utf-8", errors="replace").strip()}
+        size = os.path.getsize(file)
+        decoded = subprocess.run([FFMPEG_PATH, "-v", "error", "-i", file, "-f", "rawvideo", "-pix_fmt", "rgb24", "-"], capture_output=True).stdout
+    finally:
+        if os.path.exists(file):
+            os.remove(file)
+    decoded = np.frombuffer(decoded, dtype=np.uint8)
+    decoded_frames = min(frames, decoded.size // (width * height * 3))
+    if decoded_frames == 0:
+        return {"error": "output could not be decoded"}
+    decoded = decoded[:decoded_frames * width * height * 3].reshape(decoded_frames, height, width, 3)
+    return {"seconds": seconds, "bytes": size, "bits_per_pixel": size * 8 / (width * height * frames), "psnr": psnr(clip[:decoded_frames], decoded)}
+
+def choose_preset(results: list, min_psnr: float, max_bits_per_pixel: float) -> dict | None:
+    """Picks the fastest result that meets the quality and size targets (a size target of 0 means no limit)."""
+    valid = [r for r in results if "error" not in r and r["psnr"] >= min_psnr and (max_bits_per_pixel <= 0 or r["bits_per_pixel"] <= max_bits_per_pixel)]
+    return min(valid, key=lambda r: r["seconds"]) if valid else None
+
+def save_encoder_profile(entries: dict):
+    """Merges new benchmark entries (format to list of entries) into the encoder profile file, replacing any older entries at the same resolution."""
+    profile = load_encoder_profile() or {}
+    formats = profile.setdefault("formats", {})
+    for format, new_entries in entries.items():
+        sizes = set((entry["width"], entry["height"]) for entry in new_entries)
+        formats[format] = [entry for entry in formats.get(format, []) if (entry["width"], entry["height"]) not in sizes] + new_entries
+    path = encoder_profile_path()
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+class SwarmEncoderBenchmark:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "formats": ("STRING", {"default": "h264-mp4,h265-mp4", "tooltip": f"Comma-separated list of video formats to benchmark, from: {', '.join(ENCODER_CANDIDATES.keys())}"}),
+                "resolutions": ("STRING", {"default": "512x512,1280x720", "tooltip": "Comma-separated list of WIDTHxHEIGHT resolutions to benchmark at. Saves use the result from the benchmarked resolution closest to their own."}),
+                "frames": ("INT", {"default": 48, "min": 2, "max": 1000, "tooltip": "How many frames long the synthetic test clip is."}),
+                "fps": ("FLOAT", {"default": 24.0, "min": 0.01, "max": 1000.0, "step": 0.01}),
+                "threads": ("STRING", {"default": "0", "tooltip": "Comma-separated list of ffmpeg thread counts to try each preset with, where 0 lets ffmpeg decide."}),
+                "min_psnr": ("FLOAT", {"default": 36.0, "min": 0.0, "max": 100.0, "step": 0.1, "tooltip": "Minimum quality (PSNR in dB, measured against the source frames) a preset must reach to be chosen."}),
+                "max_bits_per_pixel": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 100.0, "step": 0.001, "tooltip": "Maximum output size (in bits per pixel per frame) a preset may produce to be chosen, or 0 for no limit."}),
+            }
+        }
+
+    CATEGORY = "SwarmUI/video"
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("report",)
+    FUNCTION = "run_benchmark"
+    OUTPUT_NODE = True
+    DESCRIPTION = "Benchmarks candidate encoder presets on a synthetic clip, and saves the fastest preset meeting the given targets to a machine-local profile that SwarmSaveAnimationWS uses when its encoder_preset is 'auto'."
+
+    def run_benchmark(self, formats, resolutions, frames, fps, threads, min_psnr, max_bits_per_pixel):
+        formats = [f.strip() for f in formats.split(",") if f.strip()]
+        for format in formats:
+            if format not in ENCODER_CANDIDATES:
+                raise ValueError(f"Unknown format '{format}', must be one of: {', '.join(ENCODER_CANDIDATES.keys())}")
+        sizes = [[int(v) for v in r.strip().lower().split("x")] for r in resolutions.split(",") if r.strip()]
+        thread_counts = [int(t) for t in threads.split(",") if t.strip()] or [0]
+        entries = {}
+        report = []
+        for width, height in sizes:
+            clip = make_synthetic_clip(width, height, frames)
+            for format in formats:
+                candidates = [DEFAULT_VIDEO_ARGS[format]] + ENCODER_CANDIDATES[format]
+                results = []
+                for video_args in candidates:
+                    for thread_count in thread_counts:
+                        result = benchmark_candidate(format, video_args, thread_count, clip, fps)
+                        result.update({"video_args": video_args, "threads": thread_count})
+                        results.append(result)
+                        if "error" in result:
+                            report.append(f"{format} {width}x{height} {' '.join(video_args)} threads={thread_count}: failed: {result['error']}")
+                        else:
+                            report.append(f"{format} {width}x{height} {' '.join(video_args)} threads={thread_count}: {result['seconds']:.2f}s, {result['bits_per_pixel']:.4f} bpp, {result['psnr']:.2f} dB")
+                chosen = choose_preset(results, min_psnr, max_bits_per_pixel)
+                chosen_text = "none, default settings will be used" if chosen is None else f"{' '.join(chosen['video_args'])} threads={chosen['threads']}"
+                report.append(f"{format} {width}x{height} chosen: {chosen_text}")
+                entries.setdefault(format, []).append({"width": width, "height": height, "frames": frames, "min_psnr": min_psnr, "max_bits_per_pixel": max_bits_per_pixel, "results": results, "chosen": chosen})
+        save_encoder_profile(entries)
+        report = "\n".join(report)
+        print(f"[Swarm] Encoder benchmark results, saved to {encoder_profile_path()}:\n{report}")
+        return (report,)
+
+    @classmethod
+    def IS_CHANGED(s, formats, resolutions, frames, fps, threads, min_psnr, max_bits_per_pixel):
+        return time.time()
+
+
+NODE_CLASS_MAPPINGS = {
+    "SwarmEncoderBenchmark": SwarmEncoderBenchmark,
+}
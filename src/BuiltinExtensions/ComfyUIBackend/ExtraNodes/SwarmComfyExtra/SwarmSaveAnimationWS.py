@@ -1,23 +1,257 @@
-import folder_paths, io, struct, subprocess, os, random, sys, time, wave
+import folder_paths, io, subprocess, os, random, sys, threading, time, torch, json, math
 from PIL import Image
 import numpy as np
-from server import PromptServer, BinaryEventTypes
 from imageio_ffmpeg import get_ffmpeg_exe
 
-SPECIAL_ID = 12345
-VIDEO_ID = 12346
 FFMPEG_PATH = get_ffmpeg_exe()
+FFMPEG_FEED_CHUNK_BYTES = 64 * 1024 * 1024 # Max bytes of uint8 frame data to convert at once while feeding ffmpeg
+STREAM_CHUNK_BYTES = 4 * 1024 * 1024 # Bytes of encoded output to forward per message when streaming (only the final message may be smaller)
+STREAMABLE_FORMATS = ["h264-mp4", "h265-mp4", "webm"] # Formats whose piped (fragmented) output can be forwarded while encoding
+MP4_STREAM_ARGS = ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"] # Fragmented MP4, only used when streaming since a regular faststart MP4 needs a seekable output
+# Default ffmpeg video args for the formats that can use benchmark-tuned presets instead (see SwarmEncoderBenchmark)
+DEFAULT_VIDEO_ARGS = {
+    "h264-mp4": ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "19"],
+    "h265-mp4": ["-c:v", "libx265", "-pix_fmt", "yuv420p"],
+    "webm": ["-pix_fmt", "yuv420p", "-crf", "23"],
+    "prores": ["-c:v", "prores_ks", "-profile:v", "3", "-pix_fmt", "yuv422p10le"],
+}
+ENCODER_PROFILE_FILENAME = "swarm_encoder_profile.json"
+GIF_PALETTE_SAMPLE_FRAMES = 16 # Max number of frames to build a GIF's shared palette from
+GIF_PALETTE_SAMPLE_PIXELS = 4 * 1024 * 1024 # Max number of pixels to build a GIF's shared palette from (frames are strided down to fit)
+# Preview settings match SwarmUI's own ffmpeg-made history previews: a full resolution JPG of the first frame, and an animated WEBP scaled to this height
+ANIM_PREVIEW_HEIGHT = 128
+ANIM_PREVIEW_FPS = 6
+ANIM_PREVIEW_SECONDS = 5
+# SwarmComfyCommon's save module, see save_image_ws()
+SAVE_IMAGE_WS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "SwarmComfyCommon", "SwarmSaveImageWS.py")
+SAVE_IMAGE_WS = None
+
+def save_image_ws():
+    """Returns SwarmComfyCommon's SwarmSaveImageWS module, for the save helpers and the async encoder that image and animation saves share.
+    Comfy loads each custom node folder under a module name built from its full path, so the already-loaded copy is found by its file rather than imported by name (which would load and run a second copy of the package).
+    This is looked up on first use, as Comfy doesn't load the custom node folders in any particular order."""
+    global SAVE_IMAGE_WS
+    if SAVE_IMAGE_WS is None:
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None)
+            if path and os.path.realpath(path) == SAVE_IMAGE_WS_PATH:
+                SAVE_IMAGE_WS = module
+                break
+        else:
+            raise RuntimeError("SwarmComfyCommon is not loaded, but SwarmSaveAnimationWS needs its SwarmSaveImageWS module")
+    return SAVE_IMAGE_WS
+
+def iter_frame_chunks(frames):
+    """Yields contiguous uint8 chunks of a few frames at a time, from either a float image tensor (quantized chunk by chunk) or an already-quantized array."""
+    frame_bytes = max(1, frames[0].numel() if isinstance(frames, torch.Tensor) else frames[0].nbytes)
+    chunk = max(1, FFMPEG_FEED_CHUNK_BYTES // frame_bytes)
+    for start in range(0, frames.shape[0], chunk):
+        if isinstance(frames, torch.Tensor):
+            yield save_image_ws().images_to_numpy(frames[start:start + chunk])
+        else:
+            yield np.ascontiguousarray(frames[start:start + chunk])
+
+def prepare_audio_pcm(audio: dict, duration: float) -> tuple[np.ndarray, int, int]:
+    """Pads or trims a Comfy audio dict to the given duration and returns (interleaved float32 pcm, sample_rate, channels)."""
+    waveform = audio['waveform']
+    if waveform.dim() == 3:
+        waveform = waveform[0]
+    sample_rate = audio['sample_rate']
+    target_samples = int(duration * sample_rate)
+    waveform = waveform[:, :target_samples]
+    if waveform.shape[1] < target_samples:
+        waveform = torch.nn.functional.pad(waveform, (0, target_samples - waveform.shape[1]))
+    pcm = waveform.to(torch.float32).clamp(-1.0, 1.0).t().contiguous().cpu().numpy()
+    return pcm, sample_rate, waveform.shape[0]
+
+def run_ffmpeg(args: list, output_args: list, frames, audio: tuple[np.ndarray, int, int] | None = None, on_output: callable = None) -> subprocess.CompletedProcess:
+    """Runs ffmpeg, feeding it rgb24 frames over stdin in fixed-size chunks so that only one chunk is ever held converted in memory.
+    `audio` is an optional (float32 pcm, sample_rate, channels) tuple, fed as a second raw input through its own pipe.
+    If `on_output` is given, stdout is passed to it piece by piece as ffmpeg produces it, instead of being collected into the result.
+    stdout and stderr are drained by background threads so that neither pipe can fill up and deadlock the feed."""
+    audio_input = []
+    pass_fds = ()
+    audio_write_fd = None
+    audio_file = None
+    if audio is not None:
+        pcm, sample_rate, channels = audio
+        if os.name == "nt":
+            # Windows can't hand extra pipe handles to a child process by number, so use a headerless temp file there
+            path = folder_paths.get_save_image_path("swarm_tmp_", folder_paths.get_temp_directory())[0]
+            audio_file = os.path.join(path, f"swarm_tmp_{'%016x' % random.getrandbits(64)}_audio.f32")
+            with open(audio_file, "wb") as f:
+                f.write(memoryview(pcm).cast('B'))
+            audio_source = audio_file
+        else:
+            audio_read_fd, audio_write_fd = os.pipe()
+            pass_fds = (audio_read_fd,)
+            audio_source = f"pipe:{audio_read_fd}"
+        audio_input = ["-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels), "-i", audio_source]
+    full_args = args + audio_input + output_args
+    try:
+        process = subprocess.Popen(full_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=pass_fds)
+    except:
+        if audio_write_fd is not None:
+            os.close(audio_write_fd)
+        if audio_file is not None:
+            os.remove(audio_file)
+        raise
+    finally:
+        for fd in pass_fds:
+            os.close(fd) # The child holds its own copy of the read end
+    outputs = {}
+    def drain(name, pipe):
+        if name == "stdout" and on_output is not None:
+            try:
+                while chunk := pipe.read1(STREAM_CHUNK_BYTES):
+                    on_output(chunk)
+            except Exception as e:
+                outputs["error"] = e
+                pipe.read()
+        else:
+            outputs[name] = pipe.read()
+    def feed_audio():
+        with os.fdopen(audio_write_fd, "wb") as pipe:
+            try:
+                pipe.write(memoryview(audio[0]).cast('B'))
+            except BrokenPipeError:
+                pass
+    readers = [threading.Thread(target=drain, args=(name, pipe), daemon=True) for name, pipe in [("stdout", process.stdout), ("stderr", process.stderr)]]
+    if audio_write_fd is not None:
+        readers.append(threading.Thread(target=feed_audio, daemon=True))
+    for reader in readers:
+        reader.start()
+    try:
+        for chunk in iter_frame_chunks(frames):
+            process.stdin.write(memoryview(chunk).cast('B'))
+    except BrokenPipeError:
+        pass # ffmpeg exited early, its return code and stderr explain why
+    except:
+        process.kill()
+        raise
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        for reader in readers:
+            reader.join()
+        process.wait()
+        if audio_file is not None:
+            os.remove(audio_file)
+    if "error" in outputs:
+        raise outputs["error"]
+    return subprocess.CompletedProcess(full_args, process.returncode, outputs.get("stdout", b""), outputs.get("stderr", b""))
+
+def build_global_palette(raw_images: np.ndarray) -> list:
+    """Builds one shared 256 color palette for a whole uint8 clip, from an evenly spaced and spatially strided subsample of its frames."""
+    indices = np.unique(np.linspace(0, len(raw_images) - 1, min(len(raw_images), GIF_PALETTE_SAMPLE_FRAMES)).round().astype(np.int64))
+    sample = raw_images[indices]
+    stride = max(1, math.ceil(math.sqrt(sample.shape[0] * sample.shape[1] * sample.shape[2] / GIF_PALETTE_SAMPLE_PIXELS)))
+    sample = np.ascontiguousarray(sample[:, ::stride, ::stride])
+    palette = Image.fromarray(sample.reshape(-1, sample.shape[2], 3)).quantize(256, method=Image.Quantize.MEDIANCUT).getpalette()[:768]
+    return palette + [0] * (768 - len(palette))
+
+def palettize_frames(raw_images: np.ndarray, palette: list) -> np.ndarray:
+    """Maps a whole uint8 clip onto one shared palette, returning an array of palette indices.
+    Frames are Floyd-Steinberg dithered against the palette, so that slow gradients and fades don't band, or collapse into runs of identical frames."""
+    palette_image = Image.new("P", (1, 1))
+    palette_image.putpalette(palette)
+    result = np.empty(raw_images.shape[:3], dtype=np.uint8)
+    for i, frame in enumerate(raw_images):
+        result[i] = np.asarray(Image.fromarray(frame).quantize(palette=palette_image, dither=Image.Dither.FLOYDSTEINBERG))
+    return result
+
+def encoder_profile_path() -> str:
+    return os.path.join(folder_paths.get_user_directory(), ENCODER_PROFILE_FILENAME)
+
+encoder_profile_cache = {"mtime": None, "profile": None}
+
+def load_encoder_profile() -> dict | None:
+    """Loads the machine-local encoder profile written by SwarmEncoderBenchmark, cached until the file changes. Returns None if there is no usable profile."""
+    path = encoder_profile_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if encoder_profile_cache["mtime"] != mtime:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: [Swarm] could not read encoder profile {path}: {e}", file=sys.stderr)
+            profile = None
+        encoder_profile_cache.update({"mtime": mtime, "profile": profile})
+    return encoder_profile_cache["profile"]
+
+def pick_tuned_preset(format: str, width: int, height: int) -> dict | None:
+    """Returns the preset the encoder benchmark chose for a format, at the benchmarked resolution closest to the given size, or None if there is none."""
+    profile = load_encoder_profile() or {}
+    entries = [entry for entry in profile.get("formats", {}).get(format, []) if entry.get("chosen")]
+    if not entries:
+        return None
+    entry = min(entries, key=lambda entry: abs(math.log((entry["width"] * entry["height"]) / (width * height))))
+    return entry["chosen"]
 
-def send_image_to_server_raw(type_num: int, save_me: callable, id: int, event_type: int = BinaryEventTypes.PREVIEW_IMAGE):
-    out = io.BytesIO()
-    header = struct.pack(">I", type_num)
-    out.write(header)
-    save_me(out)
-    out.seek(0)
-    preview_bytes = out.getvalue()
-    server = PromptServer.instance
-    server.send_sync("progress", {"value": id, "max": id}, sid=server.client_id)
-    server.send_sync(event_type, preview_bytes, sid=server.client_id)
+def resize_to_height(images: torch.Tensor, height: int) -> torch.Tensor:
+    """Scales an image batch on its own device to the given height, keeping the aspect ratio (like ffmpeg's 'scale=-1:height')."""
+    old_height, old_width = images.shape[1:3]
+    if old_height == height:
+        return images
+    target = (height, max(1, round(old_width * height / old_height)))
+    mode = "area" if height < old_height else "bilinear"
+    return torch.nn.functional.interpolate(images.movedim(-1, 1).to(dtype=torch.float32), size=target, mode=mode).clamp(0, 1).movedim(1, -1)
+
+def make_previews(images: torch.Tensor, fps: float) -> dict:
+    """Builds a JPEG of the first frame, and for multi-frame inputs a short animated WEBP preview, directly from the in-memory frames."""
+    jpg = io.BytesIO()
+    common = save_image_ws()
+    Image.fromarray(common.images_to_numpy(images[0:1])[0]).save(jpg, format='JPEG', quality=90)
+    previews = {"jpg": jpg.getvalue()}
+    if images.shape[0] > 1:
+        preview_fps = min(fps, ANIM_PREVIEW_FPS)
+        indices = sorted(set(int(i * fps / preview_fps) for i in range(math.ceil(ANIM_PREVIEW_SECONDS * preview_fps))))
+        indices = [i for i in indices if i < images.shape[0]]
+        frames = [Image.fromarray(frame) for frame in common.images_to_numpy(resize_to_height(images[indices], ANIM_PREVIEW_HEIGHT))]
+        webp = io.BytesIO()
+        frames[0].save(webp, save_all=True, duration=int(1000.0 / preview_fps), append_images=frames[1:], lossless=False, quality=60, method=0, format='WEBP', loop=0)
+        previews["webp"] = webp.getvalue()
+    return previews
+
+def send_output_to_server(type_num: int, save_me: callable, id: int, previews: dict = None, async_target: dict = None):
+    if previews is None and async_target is None:
+        save_image_ws().send_image_to_server_raw(type_num, save_me, id)
+    else:
+        save_image_ws().send_output_with_metadata_to_server(type_num, save_me, id, previews, async_target)
+
+class OutputStream:
+    """Sends an output file to the server piece by piece while it is still being encoded.
+    Written data is buffered and sent in pieces of STREAM_CHUNK_BYTES, each carrying the stream ID and a sequence number.
+    The stream ends with a final marker message that carries whatever is left in the buffer and any previews."""
+    def __init__(self, type_num: int, id: int, async_target: dict = None):
+        self.type_num = type_num
+        self.id = id
+        self.async_target = async_target
+        self.stream_id = '%016x' % random.getrandbits(64)
+        self.seq = 0
+        self.buffer = bytearray()
+
+    def send(self, data, previews: dict = None, final: bool = False):
+        stream = {"stream_id": self.stream_id, "stream_seq": self.seq}
+        if final:
+            stream["stream_final"] = True
+        save_image_ws().send_output_with_metadata_to_server(self.type_num, lambda out: out.write(data), self.id, previews, self.async_target, stream)
+        self.seq += 1
+
+    def write(self, data: bytes):
+        self.buffer += data
+        while len(self.buffer) >= STREAM_CHUNK_BYTES:
+            self.send(self.buffer[:STREAM_CHUNK_BYTES])
+            del self.buffer[:STREAM_CHUNK_BYTES]
+
+    def finish(self, previews: dict = None):
+        self.send(self.buffer, previews, True)
+        self.buffer = bytearray()
 
 
 class SwarmSaveAnimationWS:
@@ -35,7 +269,13 @@ class SwarmSaveAnimationWS:
                 "format": (["webp", "gif", "gif-hd", "h264-mp4", "h265-mp4", "webm", "prores"],),
             },
             "optional": {
-                "audio": ("AUDIO", )
+                "audio": ("AUDIO", ),
+                "preview": ("BOOLEAN", {"default": False, "tooltip": "If true, a JPEG thumbnail and a short animated WEBP preview are generated from the in-memory frames and sent along with the output, so that SwarmUI does not need to decode the saved file again to build its history previews."}),
+                "async_encode": ("BOOLEAN", {"default": False, "tooltip": "If true, the animation is encoded and sent on a background thread so the next prompt can start without waiting. Outputs are tagged with their prompt ID and delivered in order."}),
+                "stream_output": ("BOOLEAN", {"default": False, "tooltip": "If true, mp4 and webm outputs are sent in pieces as ffmpeg produces them rather than all at once after encoding finishes. Other formats ignore this."}),
+                "animation_encoder": (["pil", "ffmpeg"], {"default": "pil", "tooltip": "Which encoder to use for the 'webp' and 'gif' formats. 'pil' encodes in-process (GIFs use one palette shared by the whole clip), 'ffmpeg' encodes in a separate ffmpeg process. Other formats always use ffmpeg."}),
+                "ffmpeg_threads": ("INT", {"default": 0, "min": 0, "max": 256, "tooltip": "How many threads ffmpeg may use for encoding and filtering, or 0 to let ffmpeg decide."}),
+                "encoder_preset": (["default", "auto"], {"default": "default", "tooltip": "'auto' uses the fastest preset that met the quality and size targets when SwarmEncoderBenchmark was last run on this machine (for mp4, webm and prores), falling back to the default settings if there is no benchmark result."}),
             }
         }
 
@@ -44,123 +284,142 @@ class SwarmSaveAnimationWS:
     FUNCTION = "save_images"
     OUTPUT_NODE = True
 
-    def save_images(self, images, fps, lossless, quality, method, format, audio=None):
+    def save_images(self, images, fps, lossless, quality, method, format, audio=None, preview=False, async_encode=False, stream_output=False, animation_encoder="pil", ffmpeg_threads=0, encoder_preset="default"):
         method = self.methods.get(method)
         if images.shape[0] == 0:
             return { }
-        if images.shape[0] == 1:
-            i = 255.0 * images[0].cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+        previews = make_previews(images, fps) if preview else None
+        if async_encode:
+            raw_images = save_image_ws().images_to_numpy(images)
+            if audio is not None:
+                audio = {"waveform": audio["waveform"].cpu(), "sample_rate": audio["sample_rate"]}
+            size = raw_images.nbytes + (0 if audio is None else audio["waveform"].nbytes)
+            save_image_ws().ASYNC_ENCODER.submit(lambda target: self.encode_and_send(raw_images, previews, fps, lossless, quality, method, format, audio, stream_output, animation_encoder, ffmpeg_threads, encoder_preset, target), size, 1)
+        else:
+            self.encode_and_send(images, previews, fps, lossless, quality, method, format, audio, stream_output, animation_encoder, ffmpeg_threads, encoder_preset)
+        return { }
+
+    def encode_and_send(self, frames, previews, fps, lossless, quality, method, format, audio, stream_output=False, animation_encoder="pil", ffmpeg_threads=0, encoder_preset="default", async_target=None):
+        """Encodes and sends the output. `frames` is either the float image tensor (which ffmpeg formats then convert in chunks as they're fed) or an already-quantized uint8 array."""
+        def full_frames():
+            return frames if isinstance(frames, np.ndarray) else save_image_ws().images_to_numpy(frames)
+        if frames.shape[0] == 1:
+            img = Image.fromarray(full_frames()[0])
             def do_save(out):
                 img.save(out, format='PNG')
-            send_image_to_server_raw(2, do_save, SPECIAL_ID)
-            return { }
+            send_output_to_server(2, do_save, save_image_ws().SPECIAL_ID, None if previews is None else {"jpg": previews["jpg"]}, async_target)
+            return
 
         out_img = io.BytesIO()
-        if format in ["webp", "gif"]:
+        if format in ["webp", "gif"] and animation_encoder == "pil":
+            raw_images = full_frames()
+            height, width = raw_images.shape[1:3]
+            # Frames are zero-copy views of one clip-wide buffer
             if format == "webp":
                 type_num = 3
+                pil_images = [Image.frombuffer("RGB", (width, height), raw_image, "raw", "RGB", 0, 1) for raw_image in raw_images]
             else:
                 type_num = 4
-            pil_images = []
-            for image in images:
-                i = 255. * image.cpu().numpy()
-                img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-                pil_images.append(img)
+                palette = build_global_palette(raw_images)
+                indices = palettize_frames(raw_images, palette)
+                pil_images = [Image.frombuffer("P", (width, height), frame, "raw", "P", 0, 1) for frame in indices]
+                for img in pil_images:
+                    img.putpalette(palette)
             pil_images[0].save(out_img, save_all=True, duration=int(1000.0 / fps), append_images=pil_images[1 : len(pil_images)], lossless=lossless, quality=quality, method=method, format=format.upper(), loop=0)
         else:
-            i = 255. * images.cpu().numpy()
-            raw_images = np.clip(i, 0, 255).astype(np.uint8)
+            tuned = pick_tuned_preset(format, frames.shape[2], frames.shape[1]) if encoder_preset == "auto" and format in DEFAULT_VIDEO_ARGS else None
+            if tuned is not None and ffmpeg_threads == 0:
+                ffmpeg_threads = tuned.get("threads", 0)
             args = [FFMPEG_PATH, "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
-                    "-s", f"{len(raw_images[0][0])}x{len(raw_images[0])}", "-r", str(fps), "-i", "-", "-n" ]
+                    "-s", f"{frames.shape[2]}x{frames.shape[1]}", "-r", str(fps), "-i", "-", "-n" ]
+            if ffmpeg_threads > 0:
+                args = args[:1] + ["-filter_threads", str(ffmpeg_threads)] + args[1:]
             audio_args = None
             video_args = None
+            streaming = stream_output and format in STREAMABLE_FORMATS
+            # Output muxer args for piping the result over stdout, or None to write a (seekable) temp file with file_args instead
+            pipe_args = None
+            file_args = []
             if format == "h264-mp4":
-                video_args = ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "19"]
+                video_args = DEFAULT_VIDEO_ARGS["h264-mp4"]
                 ext = "mp4"
                 audio_args = ["-c:a", "aac"]
+                file_args = ["-movflags", "+faststart"]
+                pipe_args = MP4_STREAM_ARGS if streaming else None
                 type_num = 5
             elif format == "h265-mp4":
-                video_args = ["-c:v", "libx265", "-pix_fmt", "yuv420p"]
+                video_args = DEFAULT_VIDEO_ARGS["h265-mp4"]
                 ext = "mp4"
                 audio_args = ["-c:a", "aac"]
+                file_args = ["-movflags", "+faststart"]
+                pipe_args = MP4_STREAM_ARGS if streaming else None
                 type_num = 5
             elif format == "webm":
-                video_args = ["-pix_fmt", "yuv420p", "-crf", "23"]
+                video_args = DEFAULT_VIDEO_ARGS["webm"]
                 ext = "webm"
                 audio_args = ["-c:a", "libvorbis"]
+                pipe_args = ["-f", "webm"]
                 type_num = 6
             elif format == "prores":
-                video_args = ["-c:v", "prores_ks", "-profile:v", "3", "-pix_fmt", "yuv422p10le"]
+                # Kept as a regular (seekable) MOV since editing tools commonly mishandle fragmented MOV files
+                video_args = DEFAULT_VIDEO_ARGS["prores"]
                 ext = "mov"
-                audio_args = ["-c:a", "pcm_s16le"]
+                audio_args = ["-c:a", "pcm_s24le"]
                 type_num = 7
+            elif format == "webp":
+                video_args = ["-c:v", "libwebp_anim", "-lossless", "1" if lossless else "0", "-quality", str(quality), "-compression_level", str(method), "-loop", "0"]
+                ext = "webp"
+                pipe_args = ["-f", "webp"]
+                type_num = 3
+            elif format == "gif":
+                # Same look as the in-process encoder: one palette for the whole clip, Floyd-Steinberg dithered
+                video_args = ["-filter_complex", "split=2 [a][b]; [a] palettegen=stats_mode=full [pal]; [b] [pal] paletteuse=dither=floyd_steinberg"]
+                ext = "gif"
+                pipe_args = ["-f", "gif"]
+                type_num = 4
             elif format == "gif-hd":
                 video_args = ["-filter_complex", "split=2 [a][b]; [a] palettegen [pal]; [b] [pal] paletteuse"]
                 ext = "gif"
+                pipe_args = ["-f", "gif"]
                 type_num = 4
             path = folder_paths.get_save_image_path("swarm_tmp_", folder_paths.get_temp_directory())[0]
             rand = '%016x' % random.getrandbits(64)
-            file = os.path.join(path, f"swarm_tmp_{rand}.{ext}")
-            file_2 = None
-            audio_input = []
+            file = None if pipe_args is not None else os.path.join(path, f"swarm_tmp_{rand}.{ext}")
+            if tuned is not None:
+                video_args = tuned["video_args"]
+            if ffmpeg_threads > 0:
+                video_args = video_args + ["-threads", str(ffmpeg_threads)]
+            audio_pcm = None
             if audio is not None and audio_args is not None:
-                waveform = audio['waveform']
-                if waveform.dim() == 3:
-                    waveform = waveform[0]
-                sample_rate = audio['sample_rate']
-                channels = waveform.shape[0]
-                num_audio_samples = waveform.shape[1]
-                video_duration = len(raw_images) / fps
-                target_samples = int(video_duration * sample_rate)
-                audio_np = waveform.cpu().numpy()
-                if num_audio_samples > target_samples:
-                    audio_np = audio_np[:, :target_samples]
-                elif num_audio_samples < target_samples:
-                    padding = np.zeros((channels, target_samples - num_audio_samples), dtype=audio_np.dtype)
-                    audio_np = np.concatenate([audio_np, padding], axis=1)
-                audio_np = audio_np.T
-                audio_int16 = (np.clip(audio_np, -1.0, 1.0) * 32767).astype(np.int16)
-                file_2 = os.path.join(path, f"swarm_tmp_{rand}_audio.wav")
-                with wave.open(file_2, 'wb') as wav_file:
-                    wav_file.setnchannels(channels)
-                    wav_file.setsampwidth(2)
-                    wav_file.setframerate(sample_rate)
-                    wav_file.writeframes(audio_int16.tobytes())
-                audio_input = ["-i", file_2]
+                audio_pcm = prepare_audio_pcm(audio, frames.shape[0] / fps)
             else:
                 audio_args = []
-            result = subprocess.run(args + audio_input + video_args + audio_args + [file], input=raw_images.tobytes(), capture_output=True)
+            output_args = video_args + audio_args + (pipe_args + ["-"] if file is None else file_args + [file])
+            stream = OutputStream(type_num, save_image_ws().VIDEO_ID, async_target) if streaming else None
+            result = run_ffmpeg(args, output_args, frames, audio_pcm, None if stream is None else stream.write)
             if result.returncode != 0:
                 print(f"ffmpeg failed with return code {result.returncode}", file=sys.stderr)
-                f_out = result.stdout.decode("utf-8").strip()
+                f_out = result.stdout.decode("utf-8").strip() if file is not None else "" # stdout is the video itself when piping
                 f_err = result.stderr.decode("utf-8").strip()
                 if f_out:
                     print("ffmpeg out: " + f_out, file=sys.stderr)
                 if f_err:
                     print("ffmpeg error: " + f_err, file=sys.stderr)
                 raise Exception(f"ffmpeg failed: {f_err}")
-            # TODO: Is there a way to get ffmpeg to operate entirely in memory?
-            with open(file, "rb") as f:
-                out_img.write(f.read())
-            os.remove(file)
-            if file_2 is not None:
-                os.remove(file_2)
-
-        out = io.BytesIO()
-        header = struct.pack(">I", type_num)
-        out.write(header)
-        out.write(out_img.getvalue())
-        out.seek(0)
-        preview_bytes = out.getvalue()
-        server = PromptServer.instance
-        server.send_sync("progress", {"value": 12346, "max": 12346}, sid=server.client_id)
-        server.send_sync(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=server.client_id)
+            if stream is not None:
+                stream.finish(previews)
+                return
+            if file is None:
+                out_img.write(result.stdout)
+            else:
+                with open(file, "rb") as f:
+                    out_img.write(f.read())
+                os.remove(file)
 
-        return { }
+        send_output_to_server(type_num, lambda out: out.write(out_img.getbuffer()), save_image_ws().VIDEO_ID, previews, async_target)
 
     @classmethod
-    def IS_CHANGED(s, images, fps, lossless, quality, method, format, audio=None):
+    def IS_CHANGED(s, images, fps, lossless, quality, method, format, audio=None, preview=False, async_encode=False, stream_output=False, animation_encoder="pil", ffmpeg_threads=0, encoder_preset="default"):
         return time.time()
 
 
@@ -16,6 +16,12 @@ try:
 except ImportError:
     print("Error: [Swarm] SaveAnimationWS not available")
     traceback.print_exc()
+try:
+    from . import SwarmEncoderBenchmark
+    NODE_CLASS_MAPPINGS.update(SwarmEncoderBenchmark.NODE_CLASS_MAPPINGS)
+except ImportError:
+    print("Error: [Swarm] EncoderBenchmark not available")
+    traceback.print_exc()
 # Yolo uses Ultralytics, which is cursed
 try:
     from . import SwarmYolo
@@ -4,6 +4,7 @@ using System.Drawing;
 using System.Linq;
 using System.Text;
 using Newtonsoft.Json.Linq;
+using SwarmUI.Core;
 using SwarmUI.Text2Image;
 using SwarmUI.Utils;
 
@@ -603,11 +604,25 @@ public class WGNodeData(JArray _path, WorkflowGenerator _gen, string _dataType,
         {
             if (Features.Contains("comfy_saveimage_ws") && !WorkflowGenerator.RestrictCustomNodes)
             {
-                return Gen.CreateNode("SwarmSaveImageWS", new JObject()
+                JObject inputs = new()
                 {
                     ["images"] = Path,
                     ["bit_depth"] = UserInput.Get(T2IParamTypes.BitDepth, "8bit")
-                }, id);
+                };
+                if (Features.Contains("comfy_saveimage_ws_preview")) // Older Comfy installs have the node without this input
+                {
+                    inputs["preview"] = true;
+                }
+                // PNGs are sent as-is and get their metadata attached without re-encoding (see Session.ApplyMetadata).
+                // JPGs can only skip that when no metadata is added, as jpeg metadata can't be attached without re-encoding, so otherwise stay PNG to avoid compressing twice.
+                Settings.User.FileFormatData fileFormat = UserInput.SourceSession?.User?.Settings?.FileFormat;
+                if (Features.Contains("comfy_saveimage_ws_format") && fileFormat is not null && $"{inputs["bit_depth"]}" == "8bit" && !fileFormat.SaveMetadata && fileFormat.DPI == 0
+                    && UserInput.Get(T2IParamTypes.ImageFormat, fileFormat.ImageFormat) == "JPG")
+                {
+                    inputs["format"] = "jpg";
+                    inputs["quality"] = Math.Clamp(fileFormat.ImageQuality, 1, 100);
+                }
+                return Gen.CreateNode("SwarmSaveImageWS", inputs, id);
             }
             else
             {
@@ -631,7 +646,7 @@ public class WGNodeData(JArray _path, WorkflowGenerator _gen, string _dataType,
                 });
                 path = [bounced, 0];
             }
-            return Gen.CreateNode("SwarmSaveAnimationWS", new JObject()
+            JObject animInputs = new()
             {
                 ["images"] = path,
                 ["fps"] = FPS ?? Gen.Text2VideoFPS(),
@@ -640,7 +655,12 @@ public class WGNodeData(JArray _path, WorkflowGenerator _gen, string _dataType,
                 ["method"] = "default",
                 ["format"] = UserInput.Get(T2IParamTypes.VideoFormat, "h264-mp4"),
                 ["audio"] = AttachedAudio?.Path
-            }, id);
+            };
+            if (Features.Contains("comfy_saveanimation_ws_preview"))
+            {
+                animInputs["preview"] = true;
+            }
+            return Gen.CreateNode("SwarmSaveAnimationWS", animInputs, id);
         }
         if (DataType == DT_AUDIO)
         {
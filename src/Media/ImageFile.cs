@@ -1,5 +1,6 @@
 using SwarmUI.Utils;
 using SixLabors.ImageSharp;
+using System.Buffers.Binary;
 using System.IO;
 using SixLabors.ImageSharp.Metadata.Profiles.Exif;
 using Newtonsoft.Json.Linq;
@@ -54,6 +55,16 @@ public class ImageFile : MediaFile
         return stream.ToArray();
     }
 
+    /// <summary>Creates a png image from an already-decoded ImageSharp image, without encoding it yet.
+    /// The png bytes are only encoded if <see cref="MediaFile.RawData"/> is read, so a later <see cref="ConvertTo"/> encodes the pixels once, straight to its target format.
+    /// Takes ownership of the given image.</summary>
+    public static Image FromDecodedPixels(ISImage img)
+    {
+        Image result = new(null, MediaType.ImagePng) { _CacheISImg = img };
+        result._DeferredRawData = () => ISImgToPngBytes(img);
+        return result;
+    }
+
     /// <summary>Internal cache of <see cref="ToIS"/> to avoid reprocessing.</summary>
     public ISImage _CacheISImg;
 
@@ -372,4 +383,74 @@ public class ImageFile : MediaFile
         }
         return new Image(ms.ToArray(), type);
     }
+
+    /// <summary>Returns this image as the given format with the given metadata (or null for none), if it is already encoded in that format and the metadata can be attached without re-encoding it.
+    /// Returns null if a full <see cref="ConvertTo"/> is needed instead.</summary>
+    public ImageFile TryConvertWithoutReencode(string format, string metadata)
+    {
+        if (format == "PNG" && Type == MediaType.ImagePng)
+        {
+            return metadata is null ? this : WithPngTextChunk("parameters", metadata);
+        }
+        // Jpeg metadata lives in EXIF, which can't be added without re-encoding here
+        if (format == "JPG" && Type == MediaType.ImageJpg && metadata is null)
+        {
+            return this;
+        }
+        return null;
+    }
+
+    /// <summary>CRC table for PNG chunk checksums.</summary>
+    public static readonly uint[] PngCrcTable = [.. Enumerable.Range(0, 256).Select(n =>
+    {
+        uint c = (uint)n;
+        for (int k = 0; k < 8; k++)
+        {
+            c = (c & 1) != 0 ? 0xEDB88320u ^ (c >> 1) : c >> 1;
+        }
+        return c;
+    })];
+
+    /// <summary>Returns a copy of this PNG with a text chunk inserted after its header, in the same 'tEXt' form <see cref="ConvertTo"/> writes, without re-encoding the pixels.
+    /// Returns null if this PNG already has text or EXIF data of its own (which <see cref="ConvertTo"/> would strip), or is not a valid PNG.</summary>
+    public ImageFile WithPngTextChunk(string key, string text)
+    {
+        byte[] data = RawData;
+        const int headerEnd = 8 + 4 + 4 + 13 + 4; // Signature, then the IHDR chunk (length, type, data, crc)
+        if (data.Length < headerEnd || data[12] != 'I' || data[13] != 'H' || data[14] != 'D' || data[15] != 'R')
+        {
+            return null;
+        }
+        if (text.Any(c => c > 255)) // Not representable in a 'tEXt' chunk
+        {
+            return null;
+        }
+        for (int pos = 8; pos + 8 <= data.Length;)
+        {
+            string chunkType = System.Text.Encoding.ASCII.GetString(data, pos + 4, 4);
+            if (chunkType == "tEXt" || chunkType == "iTXt" || chunkType == "zTXt" || chunkType == "eXIf")
+            {
+                return null;
+            }
+            uint length = BinaryPrimitives.ReadUInt32BigEndian(data.AsSpan(pos));
+            if (length > data.Length - pos - 12)
+            {
+                return null;
+            }
+            pos += 12 + (int)length;
+        }
+        byte[] content = System.Text.Encoding.Latin1.GetBytes($"tEXt{key}\0{text}");
+        uint crc = 0xFFFFFFFFu;
+        foreach (byte b in content)
+        {
+            crc = PngCrcTable[(crc ^ b) & 0xFF] ^ (crc >> 8);
+        }
+        byte[] result = new byte[data.Length + content.Length + 8];
+        data.AsSpan(0, headerEnd).CopyTo(result);
+        BinaryPrimitives.WriteUInt32BigEndian(result.AsSpan(headerEnd), (uint)(content.Length - 4));
+        content.CopyTo(result, headerEnd + 4);
+        BinaryPrimitives.WriteUInt32BigEndian(result.AsSpan(headerEnd + 4 + content.Length), crc ^ 0xFFFFFFFFu);
+        data.AsSpan(headerEnd).CopyTo(result.AsSpan(headerEnd + 8 + content.Length));
+        return new Image(result, MediaType.ImagePng);
+    }
 }
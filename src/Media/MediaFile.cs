@@ -3,8 +3,36 @@ namespace SwarmUI.Media;
 /// <summary>Base class, represents a single media data file.</summary>
 public class MediaFile
 {
+    /// <summary>Backing field for <see cref="RawData"/>.</summary>
+    public byte[] _RawData;
+
+    /// <summary>If set, produces <see cref="RawData"/> on first read. Lets a file that is already held in decoded form (or spooled to disk) skip encoding or loading unless its raw bytes are actually needed.</summary>
+    public Func<byte[]> _DeferredRawData;
+
     /// <summary>The raw binary data.</summary>
-    public byte[] RawData;
+    public byte[] RawData
+    {
+        get
+        {
+            if (_RawData is null && _DeferredRawData is not null)
+            {
+                lock (this)
+                {
+                    if (_RawData is null && _DeferredRawData is not null)
+                    {
+                        _RawData = _DeferredRawData();
+                        _DeferredRawData = null;
+                    }
+                }
+            }
+            return _RawData;
+        }
+        set
+        {
+            _RawData = value;
+            _DeferredRawData = null;
+        }
+    }
 
     /// <summary>The file type.</summary>
     public MediaType Type;
@@ -24,6 +52,6 @@ public class MediaFile
     /// <inheritdoc/>
     public override string ToString()
     {
-        return $"MediaFile({Type}, {RawData.Length} bytes)";
+        return _RawData is null && _DeferredRawData is not null ? $"MediaFile({Type}, not yet encoded)" : $"MediaFile({Type}, {RawData.Length} bytes)";
     }
 }
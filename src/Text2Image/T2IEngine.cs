@@ -67,6 +67,12 @@ namespace SwarmUI.Text2Image
             /// <summary>An action that will remove/discard this file as relevant.</summary>
             public Action RefuseImage;
 
+            /// <summary>Optional pre-made JPEG preview thumbnail for this file, if the backend provided one. Used to avoid decoding the full file to build history previews.</summary>
+            public byte[] PreviewJpg;
+
+            /// <summary>Optional pre-made animated WEBP preview for this file, if the backend provided one (only for animations/videos).</summary>
+            public byte[] PreviewAnimWebp;
+
             /// <summary>Optional text identifying some internal hint from the backend, such as a Comfy Node ID. Format or content not guaranteed, use with caution and validation checks.</summary>
             public string BackendInternalHint;
         }
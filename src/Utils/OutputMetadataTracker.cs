@@ -145,7 +145,9 @@ public static class OutputMetadataTracker
     }
 
     /// <summary>Get the preview bytes for the given image, going through a cache manager.</summary>
-    public static OutputPreviewEntry GetOrCreatePreviewFor(string file)
+    /// <param name="file">The image file path.</param>
+    /// <param name="knownPreview">Optional already-made metadata-jpg preview of a still image, to avoid decoding the full file.</param>
+    public static OutputPreviewEntry GetOrCreatePreviewFor(string file, byte[] knownPreview = null)
     {
         file = file.Replace('\\', '/');
         string ext = file.AfterLast('.');
@@ -211,7 +213,7 @@ public static class OutputMetadataTracker
             return null;
         }
         long fileTime = ((DateTimeOffset)File.GetLastWriteTimeUtc(file)).ToUnixTimeSeconds();
-        byte[] fileData = null;
+        byte[] fileData = knownPreview;
         byte[] simplifiedData = null;
         try
         {
@@ -228,7 +230,7 @@ public static class OutputMetadataTracker
                     altExists = File.Exists(altPreview);
                 }
             }
-            if ((ExtensionsForFfmpegables.Contains(ext) || ExtensionsForAnimatedImages.Contains(ext) || !ExtensionsWithMetadata.Contains(ext)) && !altExists)
+            if (fileData is null && (ExtensionsForFfmpegables.Contains(ext) || ExtensionsForAnimatedImages.Contains(ext) || !ExtensionsWithMetadata.Contains(ext)) && !altExists)
             {
                 altPreview = animPreview;
                 if (ExtensionsForAnimatedImages.Contains(ext))
@@ -0,0 +1,49 @@
+using Newtonsoft.Json.Linq;
+using SwarmUI.Builtin_ComfyUIBackend;
+using System.Buffers.Binary;
+using System.Text;
+using Xunit;
+
+namespace SwarmUI.Tests;
+
+/// <summary>Tests for how the ComfyUI backend matches async outputs (from save nodes with 'async_encode' enabled) to prompts.</summary>
+public class ComfyAsyncOutputTests
+{
+    /// <summary>Builds a raw websocket output the way `send_output_with_metadata_to_server` sends it (event 4, big-endian metadata length, metadata JSON, file data).</summary>
+    public static byte[] MakeOutput(JObject metadata, byte[] data)
+    {
+        byte[] meta = Encoding.UTF8.GetBytes(metadata.ToString());
+        byte[] output = new byte[8 + meta.Length + data.Length];
+        BinaryPrimitives.WriteInt32BigEndian(output, 4);
+        BinaryPrimitives.WriteInt32BigEndian(output.AsSpan(4), meta.Length);
+        meta.CopyTo(output, 8);
+        data.CopyTo(output, 8 + meta.Length);
+        return output;
+    }
+
+    [Fact]
+    public void StaleAsyncOutputIsNotTakenByNextPrompt()
+    {
+        byte[] output = MakeOutput(new JObject() { ["mime_type"] = "image/png", ["id"] = 0, ["async_output"] = true, ["prompt_id"] = "interrupted-prompt", ["node_id"] = "9" }, [1, 2, 3]);
+        (_, _, int eventId, _) = ComfyUIAPIAbstractBackend.ComfyRawWebsocketOutputToFormatLabel(output);
+        JObject meta = ComfyUIAPIAbstractBackend.ComfyRawWebsocketOutputMetadata(output, eventId);
+        Assert.True(meta.Value<bool>("async_output"));
+        Assert.False(ComfyUIAPIAbstractBackend.IsAsyncOutputForPrompt(meta, "next-prompt"));
+        Assert.True(ComfyUIAPIAbstractBackend.IsAsyncOutputForPrompt(meta, "interrupted-prompt"));
+    }
+
+    [Fact]
+    public void StaleAsyncFailureIsNotTakenByNextPrompt()
+    {
+        JObject failure = JObject.Parse("{\"type\": \"swarm_async_output_failed\", \"data\": {\"prompt_id\": \"interrupted-prompt\", \"error\": \"ffmpeg failed\"}}");
+        Assert.False(ComfyUIAPIAbstractBackend.IsAsyncOutputForPrompt(failure["data"] as JObject, "next-prompt"));
+        Assert.True(ComfyUIAPIAbstractBackend.IsAsyncOutputForPrompt(failure["data"] as JObject, "interrupted-prompt"));
+    }
+
+    [Fact]
+    public void AsyncOutputWithoutPromptIdIsNeverMatched()
+    {
+        Assert.False(ComfyUIAPIAbstractBackend.IsAsyncOutputForPrompt(new JObject() { ["async_output"] = true }, "next-prompt"));
+        Assert.False(ComfyUIAPIAbstractBackend.IsAsyncOutputForPrompt(null, "next-prompt"));
+    }
+}
@@ -0,0 +1,45 @@
+using Newtonsoft.Json.Linq;
+using SwarmUI.Builtin_ComfyUIBackend;
+using Xunit;
+
+namespace SwarmUI.Tests;
+
+/// <summary>Tests for receiving streamed outputs (from `SwarmSaveAnimationWS` with 'stream_output' enabled).</summary>
+public class ComfyOutputStreamTests
+{
+    public static JObject Piece(int seq, bool final = false)
+    {
+        JObject meta = new() { ["stream_id"] = "abc", ["stream_seq"] = seq };
+        if (final)
+        {
+            meta["stream_final"] = true;
+        }
+        return meta;
+    }
+
+    [Fact]
+    public void PiecesAreWrittenToDiskAsTheyArrive()
+    {
+        Dictionary<string, ComfyUIAPIAbstractBackend.OutputStreamSpool> streams = [];
+        Assert.Null(ComfyUIAPIAbstractBackend.ReceiveOutputStreamPiece(streams, "abc", Piece(0), [1, 2]));
+        ComfyUIAPIAbstractBackend.OutputStreamSpool spool = streams["abc"];
+        spool.File.Flush();
+        Assert.Equal(2, new FileInfo(spool.Path).Length);
+        Assert.Null(ComfyUIAPIAbstractBackend.ReceiveOutputStreamPiece(streams, "abc", Piece(1), [3]));
+        byte[] data = ComfyUIAPIAbstractBackend.ReceiveOutputStreamPiece(streams, "abc", Piece(2, true), [4]);
+        Assert.Empty(streams);
+        Assert.Equal([1, 2, 3, 4], data);
+        Assert.False(File.Exists(spool.Path));
+    }
+
+    [Fact]
+    public void OutOfOrderPieceIsRejected()
+    {
+        Dictionary<string, ComfyUIAPIAbstractBackend.OutputStreamSpool> streams = [];
+        ComfyUIAPIAbstractBackend.ReceiveOutputStreamPiece(streams, "abc", Piece(0), [1]);
+        Assert.ThrowsAny<Exception>(() => ComfyUIAPIAbstractBackend.ReceiveOutputStreamPiece(streams, "abc", Piece(2), [2]));
+        string path = streams["abc"].Path;
+        streams["abc"].Discard();
+        Assert.False(File.Exists(path));
+    }
+}
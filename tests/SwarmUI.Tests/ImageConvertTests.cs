@@ -0,0 +1,50 @@
+using SixLabors.ImageSharp.PixelFormats;
+using SwarmUI.Media;
+using Xunit;
+
+using Image = SwarmUI.Utils.Image;
+using ISImage32 = SixLabors.ImageSharp.Image<SixLabors.ImageSharp.PixelFormats.Rgba32>;
+
+namespace SwarmUI.Tests;
+
+/// <summary>Tests for converting outputs that are already encoded in the final format, without re-encoding them.</summary>
+public class ImageConvertTests
+{
+    public static Image MakePng()
+    {
+        using ISImage32 img = new(8, 4, new Rgba32(10, 20, 30, 255));
+        return new Image(ImageFile.ISImgToPngBytes(img), MediaType.ImagePng);
+    }
+
+    [Fact]
+    public void PngGetsMetadataWithoutReencode()
+    {
+        Image png = MakePng();
+        ImageFile result = png.TryConvertWithoutReencode("PNG", "{\"sui_image_params\": {}}");
+        Assert.NotNull(result);
+        Assert.Equal(MediaType.ImagePng, result.Type);
+        Assert.Equal("{\"sui_image_params\": {}}", result.GetMetadata());
+        Assert.Equal((8, 4), result.GetResolution());
+        // The pixel data is untouched, only the chunk is added
+        Assert.Equal(png.RawData.Length + 8 + 4 + "parameters".Length + 1 + "{\"sui_image_params\": {}}".Length, result.RawData.Length);
+        Assert.Same(png, png.TryConvertWithoutReencode("PNG", null));
+    }
+
+    [Fact]
+    public void OtherFormatsNeedConversion()
+    {
+        Image png = MakePng();
+        Assert.Null(png.TryConvertWithoutReencode("JPG", null));
+        Assert.Null(png.TryConvertWithoutReencode("WEBP", null));
+        ImageFile jpg = png.ConvertTo("JPG", null, quality: 90);
+        Assert.Same(jpg, jpg.TryConvertWithoutReencode("JPG", null));
+        Assert.Null(jpg.TryConvertWithoutReencode("JPG", "metadata"));
+    }
+
+    [Fact]
+    public void PngWithExistingTextIsReencoded()
+    {
+        ImageFile tagged = MakePng().ConvertTo("PNG", "old metadata");
+        Assert.Null(tagged.TryConvertWithoutReencode("PNG", "new metadata"));
+    }
+}